@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Aperture geometry of the instrument footprints.
+
+The aperture tables in the data directory are parsed once, at import, into
+contiguous arrays together with everything derived from them: the unit
+vectors of the vertices, the centre of every aperture and the rotation
+reference point of the whole footprint. The arrays can be stored in a binary
+apertures.npz next to the tables (python -m jwst_footprints.apertures), which
+is then preferred over the text tables while it is newer than all of them.
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from . import PKG_DATA_DIR
+
+# number of vertices of every aperture polygon in the aperture tables
+NVERTICES = 5
+
+# aperture table of each instrument footprint and the apertures whose centres
+# define its rotation reference point; the centres are averaged in pairs,
+# i.e. (0, 4, 1, 5) gives ((c0 + c4) / 2 + (c1 + c5) / 2) / 2
+TABLES = OrderedDict([
+    ('long', ('table-nircam-long.txt', (0, 1))),
+    ('short', ('table-nircam-short.txt', (0, 4, 1, 5))),
+    ('msa', ('table-nirspec-msa.txt', (0, 2, 1, 3))),
+    ('ifu', ('table-nirspec-ifu.txt', (0,))),
+])
+
+CACHE_FILE = os.path.join(PKG_DATA_DIR, 'apertures.npz')
+
+
+def unit(ra, dec):
+    ''' Converts vector expressed in Euler angles to unit vector components.
+    ra and dec in degrees, either scalars or arrays of the same shape
+    (the result then has shape (3,) + ra.shape)
+    Can be used for V2V3 after converting from arcsec to degrees)'''
+
+    rar = np.radians(ra)
+    decr = np.radians(dec)
+    u = np.array([np.cos(rar) * np.cos(decr),
+                  np.sin(rar) * np.cos(decr),
+                  np.sin(decr)])
+    return u
+
+
+def _midpoint(points):
+    while len(points) > 1:
+        points = [(points[i] + points[i + 1]) / 2.0
+                  for i in range(0, len(points), 2)]
+    return points[0]
+
+
+class ApertureTable(object):
+    """
+    Vertices of the apertures of one instrument footprint and their derived
+    geometry:
+
+    v2, v3      vertex positions (arcsec)
+    names       aperture names, one per polygon
+    vectors     unit vectors of the vertices, shape (3, len(v2))
+    centroids   centre of every aperture, shape (2, len(names))
+    reference   V2, V3 of the rotation reference point of the footprint
+    """
+
+    def __init__(self, instrument, v2, v3, names, vectors, centroids,
+                 reference):
+        self.instrument = instrument
+        self.v2 = v2
+        self.v3 = v3
+        self.names = names
+        self.vectors = vectors
+        self.centroids = centroids
+        self.reference = reference
+
+    @classmethod
+    def from_table(cls, instrument, inputfile, reference_apertures):
+        v2 = []
+        v3 = []
+        names = []
+        with open(inputfile, 'r') as fp:
+            for row in fp:
+                cols = row.split()
+                if not cols:
+                    continue
+                v2.append(float(cols[0]))
+                v3.append(float(cols[1]))
+                names.append(cols[2])
+        v2 = np.ascontiguousarray(v2, np.float64)
+        v3 = np.ascontiguousarray(v3, np.float64)
+        names = np.array(names[::NVERTICES])
+
+        vectors = np.ascontiguousarray(unit(v2 / 3600.0, v3 / 3600.0))
+
+        # search point in the center of each aperture
+        centroids = np.array([(v2[0::NVERTICES] + v2[2::NVERTICES]) / 2.0,
+                              (v3[0::NVERTICES] + v3[2::NVERTICES]) / 2.0])
+        reference = _midpoint([centroids[:, i] for i in reference_apertures])
+
+        return cls(instrument, v2, v3, names, vectors, centroids,
+                   tuple(float(x) for x in reference))
+
+    @property
+    def napertures(self):
+        return len(self.names)
+
+
+def _tables_mtime():
+    return max(os.path.getmtime(os.path.join(PKG_DATA_DIR, table))
+               for table, reference_apertures in TABLES.values())
+
+
+def load(cachefile=CACHE_FILE):
+    """Reads every aperture table, from cachefile if it is up to date"""
+    apertures = OrderedDict()
+
+    if (os.path.exists(cachefile) and
+            os.path.getmtime(cachefile) >= _tables_mtime()):
+        with np.load(cachefile) as cache:
+            for instrument in TABLES:
+                apertures[instrument] = ApertureTable(
+                    instrument,
+                    cache[instrument + '_v2'],
+                    cache[instrument + '_v3'],
+                    cache[instrument + '_names'],
+                    cache[instrument + '_vectors'],
+                    cache[instrument + '_centroids'],
+                    tuple(float(x) for x in
+                          cache[instrument + '_reference']))
+        return apertures
+
+    for instrument, (table, reference_apertures) in TABLES.items():
+        apertures[instrument] = ApertureTable.from_table(
+            instrument, os.path.join(PKG_DATA_DIR, table),
+            reference_apertures)
+    return apertures
+
+
+def save(apertures, cachefile=CACHE_FILE):
+    """Stores the aperture geometry in a binary cachefile"""
+    arrays = {}
+    for instrument, aperture in apertures.items():
+        arrays[instrument + '_v2'] = aperture.v2
+        arrays[instrument + '_v3'] = aperture.v3
+        arrays[instrument + '_names'] = aperture.names
+        arrays[instrument + '_vectors'] = aperture.vectors
+        arrays[instrument + '_centroids'] = aperture.centroids
+        arrays[instrument + '_reference'] = np.array(aperture.reference)
+    np.savez(cachefile, **arrays)
+
+
+APERTURES = load()
+
+
+if __name__ == '__main__':
+    save(load(cachefile=''))
+    print('wrote ' + CACHE_FILE)
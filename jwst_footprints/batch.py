@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Headless footprints for a table of targets.
+
+The target table is an ASCII table with a header line and the columns
+
+    name  ra  dec  pa  [dither]  [instruments]
+
+ra, dec in degrees or as hh:mm:ss.sss dd:mm:ss.sss, pa in degrees, dither a
+pattern name of the dither registry (default None) and instruments a comma
+separated subset of long,short,msa (default all three). The names must
+differ also once made safe for the file system, ignoring case. The rows are
+processed on a pool of worker processes; every target gets a directory in
+outdir with its footprints and, on request, their export formats (STC-S,
+GeoJSON, MOC...), its region files on an image (or in sky coordinates,
+without an image) and its visibility, and
+outdir/summary.txt lists the result of every row.
+
+Nothing here imports Tk, PIL or pyds9.
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import multiprocessing
+import os
+import re
+
+import numpy as np
+from astropy.io import ascii
+
+from .footprints import (DITHER_PATTERNS, compute_footprints,
+                         footprint_regions, parse_radec)
+from .image_wcs import image_chips
+from .coverage import polygon_edges
+from .export import EXPORT_FORMATS, check_formats, export_footprints
+from .find_tgt_info import rollangle
+from .regions import REGION_SYSTEMS
+
+INSTRUMENTS = ('long', 'short', 'msa')
+
+SUMMARY_COLUMNS = ('name', 'ra', 'dec', 'pa', 'dither', 'instruments',
+                   'npolygons', 'visible_days', 'status')
+
+
+def read_targets(targetfile):
+    '''Reads the target table into a list of dictionaries, one per row.
+    Raises ValueError for two names with the same target_dir()'''
+    table = ascii.read(targetfile)
+    for column in ('name', 'ra', 'dec', 'pa'):
+        if column not in table.colnames:
+            raise ValueError('{}: missing column {}'.format(
+                targetfile, column))
+
+    targets = []
+    rows = {}
+    for number, row in enumerate(table, 1):
+        # every target writes to its own directory, also on the file
+        # systems that ignore case
+        safe = safe_name(str(row['name'])).lower()
+        if safe in rows:
+            raise ValueError(
+                '{}: targets {} and {} ({!r}, {!r}) share a directory'.format(
+                    targetfile, rows[safe], number,
+                    targets[rows[safe] - 1]['name'], str(row['name'])))
+        rows[safe] = number
+        target = {
+            'name': str(row['name']),
+            'ra': str(row['ra']),
+            'dec': str(row['dec']),
+            'pa': float(row['pa']),
+            'dither': 'None',
+            'instruments': ','.join(INSTRUMENTS),
+        }
+        if 'dither' in table.colnames:
+            target['dither'] = str(row['dither'])
+        if 'instruments' in table.colnames:
+            target['instruments'] = str(row['instruments'])
+        targets.append(target)
+    return targets
+
+
+def safe_name(name):
+    '''Target name made safe for the file system'''
+    return re.sub(r'[^\w.+-]', '_', name)
+
+
+def target_dir(outdir, name):
+    '''Output directory of a target, named after its safe_name()'''
+    return os.path.join(outdir, safe_name(name))
+
+
+def process_target(task):
+    '''Computes and writes the footprints of one target.
+    task is (target, outdir, inputfile, visibility, system, formats) with
+    target a row of read_targets(), system the coordinate system of the
+    region files and formats the export formats (see export_footprints);
+    sky regions (fk5, icrs) are written without inputfile. Errors
+    are reported in the returned summary row instead of being raised, so
+    that one bad row does not stop the batch'''
+    target, outdir, inputfile, visibility, system, formats = task
+
+    summary = dict(target, npolygons=0, visible_days=-1, status='ok')
+    try:
+        instruments = target['instruments'].split(',')
+        unknown = set(instruments) - set(INSTRUMENTS)
+        if unknown:
+            raise ValueError('unknown instruments ' +
+                             ','.join(sorted(unknown)))
+        if target['dither'] not in DITHER_PATTERNS:
+            raise ValueError('unknown dither pattern ' + target['dither'])
+
+        ra, dec = parse_radec(target['ra'].replace(':', ' '),
+                              target['dec'].replace(':', ' '))
+        summary['ra'] = ra
+        summary['dec'] = dec
+        plot = dict((x, 'Yes' if x in instruments else 'No')
+                    for x in INSTRUMENTS)
+
+        fp = compute_footprints(plot['long'], plot['short'], plot['msa'],
+                                ra, dec, target['pa'], target['dither'],
+                                ra, dec, target['pa'])
+        summary['npolygons'] = len(fp)
+
+        targetdir = target_dir(outdir, target['name'])
+        if not os.path.exists(targetdir):
+            os.makedirs(targetdir, mode=0o0755)
+        np.save(os.path.join(targetdir, 'footprints.npy'), fp)
+        if formats:
+            export_footprints(fp, targetdir, formats)
+
+        nircam_name = DITHER_PATTERNS[target['dither']]['suffix']
+        regions = dict(
+            names={'long': nircam_name, 'short': nircam_name, 'msa': None},
+            colors={'long': 'blue', 'short': 'green', 'msa': 'red'},
+            centres=dict((x, (ra, dec)) for x in INSTRUMENTS))
+        if system != 'image':
+            footprint_regions(fp, None, targetdir, system=system, **regions)
+        elif inputfile is not None:
+            chips = image_chips(inputfile)
+            centres, radii = polygon_edges(fp)[:2]
+            for image in chips:
+                chipdir = targetdir
+                selected = fp
+                if len(chips) > 1:
+                    chipdir = os.path.join(targetdir, image.name)
+                    selected = fp[image.overlaps(centres, radii)]
+                    if len(selected) == 0:
+                        continue
+                footprint_regions(selected, image, chipdir, **regions)
+
+        if visibility:
+            rollangle(ra, dec, targetdir)
+            with open(os.path.join(targetdir,
+                                   'v3pa_nircam_nirspec.txt')) as days:
+                summary['visible_days'] = sum(1 for line in days)
+    except Exception as e:
+        summary['status'] = 'error: {}'.format(e)
+
+    return summary
+
+
+def run(targetfile, outdir, inputfile=None, visibility=False,
+        processes=None, chunksize=1, system='image', formats=()):
+    '''Processes every row of the target table on a pool of processes
+    (all the CPUs by default) and writes outdir/summary.txt. The region
+    files are written in the coordinate system system, image (only with an
+    inputfile) or fk5/icrs, and the footprints of every target are also
+    exported in formats, names of EXPORT_FORMATS.
+    Returns the list of summary rows'''
+    # a missing optional package would otherwise fail every row
+    check_formats(formats)
+    targets = read_targets(targetfile)
+    if not os.path.exists(outdir):
+        os.makedirs(outdir, mode=0o0755)
+        print("creating directory " + outdir)
+
+    tasks = [(target, outdir, inputfile, visibility, system, formats)
+             for target in targets]
+    summaries = []
+    summaryfile = os.path.join(outdir, 'summary.txt')
+    pool = multiprocessing.Pool(processes)
+    try:
+        with open(summaryfile, 'w') as fp:
+            fp.write('# ' + ' '.join(SUMMARY_COLUMNS) + '\n')
+            for summary in pool.imap(process_target, tasks, chunksize):
+                fp.write('"{name}" {ra} {dec} {pa} {dither} {instruments} '
+                         '{npolygons} {visible_days} "{status}"\n'.format(
+                             **summary))
+                summaries.append(summary)
+    finally:
+        pool.close()
+        pool.join()
+
+    nfailed = sum(1 for x in summaries if x['status'] != 'ok')
+    print('{} targets processed, {} failed, summary in {}'.format(
+        len(summaries), nfailed, summaryfile))
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Computes JWST footprints for a table of targets')
+    parser.add_argument('targets',
+                        help='target table with columns name ra dec pa '
+                             '[dither] [instruments]')
+    parser.add_argument('-o', '--outdir', default='.',
+                        help='output directory (default: %(default)s)')
+    parser.add_argument('-i', '--image', default=None,
+                        help='FITS image to write DS9 region files for')
+    parser.add_argument('-s', '--system', default='image',
+                        choices=REGION_SYSTEMS,
+                        help='coordinate system of the region files; fk5 '
+                             'and icrs need no image (default: %(default)s)')
+    parser.add_argument('-e', '--export', action='append', default=[],
+                        choices=list(EXPORT_FORMATS),
+                        help='also export the footprints in this format; '
+                             'can be repeated')
+    parser.add_argument('-v', '--visibility', action='store_true',
+                        help='also write the allowed V3 PA per day')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of worker processes (default: all CPUs)')
+    parser.add_argument('--chunksize', type=int, default=1,
+                        help='targets handed to a worker at a time')
+    args = parser.parse_args()
+    try:
+        check_formats(args.export)
+    except ImportError as e:
+        parser.error(str(e))
+
+    try:
+        run(args.targets, args.outdir, args.image, args.visibility,
+            args.processes, args.chunksize, args.system, args.export)
+    except ValueError as e:
+        # a target table that cannot be processed
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
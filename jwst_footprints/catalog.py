@@ -0,0 +1,599 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Source lists of ra dec [type] rows, read in chunks of rows.
+
+A catalog of millions of sources is never held in memory: every chunk is
+parsed straight into float64 arrays of ra and dec, and the type column into
+small integer codes indexing SourceCatalog.categories, and handed on to be
+projected and written before the next chunk is read.
+
+Besides whitespace separated text, open_catalog() reads binary tables, of
+which only the ra, dec and type columns are read: FITS binary tables (memory
+mapped), NumPy .npy (memory mapped) and .npz files and, when pyarrow is
+installed, Parquet files. Any of them can be gzip or bzip2 compressed
+(.gz, .bz2), and is then decompressed on the fly instead of memory mapped.
+
+A text list can also be parsed once into a cache directory: cached_catalog()
+keeps the parsed rows there, keyed by the SHA-1 of the file contents, and
+reads them back memory mapped on the next runs.
+"""
+from __future__ import absolute_import, division, print_function
+
+import bz2
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+from astropy.io import fits
+
+from . import CACHE_DIR
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# rows parsed at a time
+CHUNKSIZE = 1 << 18
+
+# opener of the compressed files of every file name suffix
+COMPRESSIONS = {'.gz': gzip.open, '.bz2': bz2.BZ2File}
+
+# disk space the parsed catalogs may take in the cache directory, in bytes
+CACHE_BUDGET = 2 << 30
+
+# bytes read at a time to hash a file
+HASH_BLOCK = 1 << 20
+
+# renames over an existing file, also on Windows (Python 3)
+_replace = getattr(os, 'replace', os.rename)
+
+# column names looked for, case insensitively, when none are given
+COLUMN_NAMES = (('ra', 'raj2000', 'ra_deg', 'alpha_j2000', 'ra_icrs'),
+                ('dec', 'dej2000', 'decj2000', 'dec_deg', 'delta_j2000',
+                 'de_icrs'),
+                ('type', 'class', 'sourcetype', 'category'))
+
+
+def _compression(filename):
+    # opener of a compressed file, None if it is not compressed
+    return COMPRESSIONS.get(os.path.splitext(filename)[1].lower())
+
+
+def _open_binary(filename):
+    opener = _compression(filename)
+    if opener is None:
+        return open(filename, 'rb')
+    return opener(filename, 'rb')
+
+
+def _open_text(filename):
+    if _compression(filename) is None:
+        return open(filename, 'r')
+    return io.TextIOWrapper(_open_binary(filename))
+
+
+def catalog_extension(filename):
+    '''Extension of a catalog file name, in lower case and without its
+    compression suffix: .fits for catalog.fits.gz'''
+    root, extension = os.path.splitext(filename.lower())
+    if extension in COMPRESSIONS:
+        extension = os.path.splitext(root)[1]
+    return extension
+
+
+class SourceCatalog(object):
+    """
+    Whitespace separated source list with ra, dec in degrees and an optional
+    source type in the third column; further columns, blank lines and lines
+    starting with # are ignored. Every row has the number of columns of the
+    first one.
+    """
+
+    def __init__(self, filename, chunksize=CHUNKSIZE):
+        self.filename = filename
+        self.chunksize = chunksize
+        self.ncolumns = self._count_columns()
+        # type names, in the order they were first met; the codes of
+        # chunks() index this list
+        self.categories = []
+        self._codes = {}
+
+    def _count_columns(self):
+        with _open_text(self.filename) as fp:
+            for line in fp:
+                if line.strip() and not line.lstrip().startswith('#'):
+                    return len(line.split())
+        return 0
+
+    @property
+    def has_types(self):
+        return self.ncolumns >= 3
+
+    def code(self, category):
+        '''Code of a source type, or None if the catalog has none so far'''
+        return self._codes.get(category)
+
+    def chunks(self):
+        '''Yields (start, ra, dec, codes) for every chunk of rows: the index of
+        the first source of the chunk, float64 arrays of ra and dec and a
+        uint16 array of type codes (None without a type column)'''
+        ncolumns = self.ncolumns
+        step = ncolumns + 1
+        start = 0
+        lineno = 0
+        with _open_text(self.filename) as fp:
+            while True:
+                lines = list(itertools.islice(fp, self.chunksize))
+                if not lines:
+                    break
+                first = lineno + 1
+                lineno += len(lines)
+                rows = [x for x in lines
+                        if x.strip() and not x.lstrip().startswith('#')]
+                n = len(rows)
+                if n == 0:
+                    continue
+                # the rows are joined with a NUL token in between, which
+                # falls every ncolumns + 1 tokens only if no row has a
+                # missing or extra column
+                tokens = ' \0 '.join(rows).split()
+                if (len(tokens) != n * step - 1 or
+                        tokens[ncolumns::step].count('\0') != n - 1):
+                    self._check_rows(lines, first)
+
+                ra = np.fromiter(map(float, tokens[0::step]), np.float64, n)
+                dec = np.fromiter(map(float, tokens[1::step]), np.float64, n)
+                codes = None
+                if self.has_types:
+                    codes = np.fromiter(
+                        (self._code(x) for x in tokens[2::step]),
+                        np.uint16, n)
+
+                yield (start, ra, dec, codes)
+                start += n
+
+    def _check_rows(self, lines, first):
+        # raises for the first of lines, numbered from first, whose number
+        # of columns differs from the one of the catalog
+        for lineno, line in enumerate(lines, first):
+            fields = line.split()
+            if (fields and not fields[0].startswith('#') and
+                    len(fields) != self.ncolumns):
+                raise ValueError(
+                    '{}, line {}: {} columns instead of {}'.format(
+                        self.filename, lineno, len(fields), self.ncolumns))
+        raise ValueError('{}: unreadable rows in lines {} to {}'.format(
+            self.filename, first, first + len(lines) - 1))
+
+    def _code(self, category):
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+
+def _find_columns(names, columns, filename):
+    # names of the ra, dec and type (None if absent) columns among names,
+    # either the ones given in columns or the first of COLUMN_NAMES present
+    if columns is not None:
+        columns = list(columns) + [None] * (3 - len(columns))
+        for column in columns:
+            if column is not None and column not in names:
+                raise ValueError('{}: no column {}'.format(filename, column))
+        return columns
+
+    lower = dict((str(x).lower(), x) for x in reversed(list(names)))
+    columns = []
+    for candidates in COLUMN_NAMES:
+        found = [lower[x] for x in candidates if x in lower]
+        columns.append(found[0] if found else None)
+    if columns[0] is None or columns[1] is None:
+        raise ValueError('{}: no ra, dec columns among {}'.format(
+            filename, ', '.join(str(x) for x in names)))
+    return columns
+
+
+def _category(value):
+    # type name of a type column value
+    if isinstance(value, bytes):
+        return value.decode('ascii', 'replace').strip()
+    return str(value).strip()
+
+
+class TableCatalog(SourceCatalog):
+    """
+    Base of the binary catalogs: ra, dec and type are columns of a table
+    read by _read(start, stop) a chunk of rows at a time. columns is
+    (ra, dec[, type]) naming the columns; by default they are found by name
+    among COLUMN_NAMES.
+    """
+
+    def __init__(self, filename, columns=None, chunksize=CHUNKSIZE):
+        self.filename = filename
+        self.chunksize = chunksize
+        self.categories = []
+        self._codes = {}
+        self.nrows = 0
+        self.columns = self._open(columns)
+        # ra, dec and type read as the columns of a text catalog
+        self.ncolumns = 2 if self.columns[2] is None else 3
+
+    def chunks(self):
+        for start in range(0, self.nrows, self.chunksize):
+            stop = min(start + self.chunksize, self.nrows)
+            yield (start,) + self._convert(*self._read(start, stop))
+
+    def _convert(self, ra, dec, types):
+        # float64 ra, dec and the type codes of columns of a chunk
+        codes = None
+        if types is not None:
+            values, inverse = np.unique(np.asarray(types),
+                                        return_inverse=True)
+            lookup = np.array([self._code(_category(x))
+                               for x in values.tolist()], np.uint16)
+            codes = lookup[inverse.ravel()]
+        return (np.asarray(ra, np.float64), np.asarray(dec, np.float64),
+                codes)
+
+
+class FitsCatalog(TableCatalog):
+    """
+    Catalog in the first binary table extension of a FITS file holding the
+    ra, dec columns. The rows of the table are memory mapped as they are
+    stored, big endian, so only the rows of a chunk of the columns read are
+    brought in and converted.
+    """
+
+    def _open(self, columns):
+        compressed = _compression(self.filename) is not None
+        with fits.open(self.filename, memmap=not compressed) as hdul:
+            for ext, hdu in enumerate(hdul):
+                if not isinstance(hdu, fits.BinTableHDU):
+                    continue
+                try:
+                    found = _find_columns(hdu.columns.names, columns,
+                                          self.filename)
+                except ValueError:
+                    continue
+                break
+            else:
+                raise ValueError(self.filename + ': no binary table with '
+                                 'ra, dec columns')
+
+            dtype = hdu.columns.dtype.newbyteorder('>')
+            if dtype.itemsize != hdu.header['NAXIS1']:
+                raise ValueError(self.filename + ': unsupported table '
+                                 'layout')
+            self.nrows = hdu.header['NAXIS2']
+            # TSCALn, TZEROn of the columns read
+            self._scaling = [None if x is None else
+                             (hdu.columns[x].bscale, hdu.columns[x].bzero)
+                             for x in found]
+            offset = hdul.fileinfo(ext)['datLoc']
+        if compressed:
+            # the same rows, decompressed into memory
+            with _open_binary(self.filename) as fp:
+                fp.seek(offset)
+                self._data = np.frombuffer(
+                    fp.read(dtype.itemsize * self.nrows), dtype)
+        else:
+            self._data = np.memmap(self.filename, dtype=dtype, mode='r',
+                                   offset=offset, shape=(self.nrows,))
+        return found
+
+    def _read(self, start, stop):
+        values = []
+        for column, scaling in zip(self.columns, self._scaling):
+            if column is None:
+                values.append(None)
+                continue
+            value = self._data[column][start:stop]
+            bscale, bzero = scaling
+            if bscale is not None or bzero is not None:
+                value = (value * (1.0 if bscale is None else bscale) +
+                         (0.0 if bzero is None else bzero))
+            values.append(value)
+        return tuple(values)
+
+
+class NumpyCatalog(TableCatalog):
+    """
+    Catalog in a NumPy file: a .npy structured array (columns by field
+    name) or 2-D array (columns by index, 0, 1 and 2 by default), memory
+    mapped, or a .npz archive with one array per column, of which only the
+    ones read are loaded.
+    """
+
+    def _open(self, columns):
+        if _compression(self.filename) is None:
+            data = np.load(self.filename, mmap_mode='r')
+        else:
+            with _open_binary(self.filename) as fp:
+                data = np.load(io.BytesIO(fp.read()))
+        if isinstance(data, np.lib.npyio.NpzFile):
+            if len(data.files) == 1:
+                data = data[data.files[0]]
+            else:
+                found = _find_columns(data.files, columns, self.filename)
+                self._data = dict((x, data[x]) for x in found
+                                  if x is not None)
+                data.close()
+                self.nrows = len(self._data[found[0]])
+                return found
+
+        if data.dtype.names is not None:
+            self._data = data
+            found = _find_columns(data.dtype.names, columns, self.filename)
+        elif data.ndim == 2:
+            self._data = data.T
+            if columns is None:
+                columns = range(min(data.shape[1], 3))
+            found = _find_columns(range(data.shape[1]), columns,
+                                  self.filename)
+        else:
+            raise ValueError(self.filename + ': not a table')
+        self.nrows = len(data)
+        return found
+
+    def _read(self, start, stop):
+        return tuple(None if x is None else self._data[x][start:stop]
+                     for x in self.columns)
+
+
+class ParquetCatalog(TableCatalog):
+    """
+    Catalog in a Parquet file, read with pyarrow a batch of rows of the ra,
+    dec and type columns at a time.
+    """
+
+    def _open(self, columns):
+        if pq is None:
+            raise ImportError('reading Parquet catalogs needs pyarrow')
+        source = self.filename
+        if _compression(self.filename) is not None:
+            with _open_binary(self.filename) as fp:
+                source = io.BytesIO(fp.read())
+        self._file = pq.ParquetFile(source)
+        self.nrows = self._file.metadata.num_rows
+        return _find_columns(self._file.schema_arrow.names, columns,
+                             self.filename)
+
+    def chunks(self):
+        names = [x for x in self.columns if x is not None]
+        start = 0
+        for batch in self._file.iter_batches(batch_size=self.chunksize,
+                                             columns=names):
+            arrays = [batch.column(names.index(x)).to_numpy(
+                zero_copy_only=False) if x is not None else None
+                for x in self.columns]
+            yield (start,) + self._convert(*arrays)
+            start += batch.num_rows
+
+
+# catalog class of every file name extension, text otherwise
+CATALOG_FORMATS = {
+    '.fits': FitsCatalog,
+    '.fit': FitsCatalog,
+    '.fts': FitsCatalog,
+    '.npy': NumpyCatalog,
+    '.npz': NumpyCatalog,
+    '.parquet': ParquetCatalog,
+    '.pq': ParquetCatalog,
+}
+
+
+def open_catalog(filename, columns=None, chunksize=CHUNKSIZE, cache_budget=0):
+    '''Source catalog of a file, read according to its extension (without
+    a .gz or .bz2 compression suffix) as listed in CATALOG_FORMATS, as a
+    whitespace separated text SourceCatalog otherwise. columns
+    (ra, dec[, type]) names the columns of a binary table; they are found
+    by name by default. With a cache_budget (bytes), a text list is read
+    through cached_catalog()'''
+    cls = CATALOG_FORMATS.get(catalog_extension(filename))
+    if cls is None:
+        if cache_budget:
+            return cached_catalog(filename, chunksize, budget=cache_budget)
+        return SourceCatalog(filename, chunksize)
+    return cls(filename, columns, chunksize)
+
+
+class CachedCatalog(TableCatalog):
+    """
+    Text catalog parsed by cached_catalog(): filename is the JSON file of
+    its row count and type names next to the file of its (ra, dec[, code])
+    records, which is memory mapped.
+    """
+
+    def _open(self, columns):
+        with open(self.filename, 'r') as fp:
+            meta = json.load(fp)
+        self.nrows = meta['nrows']
+        self.categories = meta['categories']
+        self._codes = dict((x, i) for i, x in enumerate(self.categories))
+
+        found = ['ra', 'dec', 'code' if meta['types'] else None]
+        dtype = _cache_dtype(meta['types'])
+        if self.nrows == 0:
+            self._data = np.zeros(0, dtype)
+        else:
+            self._data = np.memmap(_cache_data(self.filename), dtype=dtype,
+                                   mode='r', shape=(self.nrows,))
+        return found
+
+    def _read(self, start, stop):
+        return tuple(None if x is None else self._data[x][start:stop]
+                     for x in self.columns)
+
+    def _convert(self, ra, dec, codes):
+        # the codes are stored already
+        return (np.asarray(ra, np.float64), np.asarray(dec, np.float64),
+                None if codes is None else np.asarray(codes, np.uint16))
+
+
+def _cache_dtype(types):
+    # records of the parsed catalogs, little endian
+    dtype = [('ra', '<f8'), ('dec', '<f8')]
+    if types:
+        dtype.append(('code', '<u2'))
+    return dtype
+
+
+def _cache_data(metafile):
+    return os.path.splitext(metafile)[0] + '.bin'
+
+
+def file_hash(filename):
+    '''SHA-1 hex digest of the contents of a file'''
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(HASH_BLOCK), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _read_index(indexfile):
+    if not os.path.exists(indexfile):
+        return {}
+    try:
+        with open(indexfile, 'r') as fp:
+            return json.load(fp)
+    except ValueError:
+        return {}
+
+
+@contextmanager
+def _locked(lockfile):
+    # exclusive lock across processes, e.g. the workers of a batch run, on
+    # the platforms that have fcntl
+    with open(lockfile, 'a') as fp:
+        if fcntl is not None:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+
+def _content_key(filename, cachedir):
+    # SHA-1 of a file, hashed again only when its size or modification time
+    # differ from the ones recorded in the index of cachedir
+    indexfile = os.path.join(cachedir, 'index.json')
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime]
+    index = _read_index(indexfile)
+    if path in index and index[path][:2] == stamp:
+        return index[path][2]
+
+    key = file_hash(path)
+    # the index is read again under the lock, so that the entries other
+    # processes added meanwhile are kept
+    with _locked(os.path.join(cachedir, 'index.lock')):
+        index = _read_index(indexfile)
+        index[path] = stamp + [key]
+        # entries of files gone
+        for x in [x for x in index if not os.path.exists(x)]:
+            del index[x]
+        _write_atomic(indexfile, json.dumps(index, indent=1).encode('utf-8'))
+    return key
+
+
+def _write_atomic(filename, data):
+    # written under a temporary name first, so that other runs see either
+    # the whole file or none
+    temporary = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(temporary, 'wb') as fp:
+        fp.write(data)
+    _replace(temporary, filename)
+
+
+def _store_catalog(catalog, metafile):
+    # parses catalog into the records file of metafile, then writes
+    # metafile, which marks the entry as complete
+    datafile = _cache_data(metafile)
+    temporary = '{}.{}.tmp'.format(datafile, os.getpid())
+    dtype = _cache_dtype(catalog.has_types)
+    nrows = 0
+    with open(temporary, 'wb') as fp:
+        for start, ra, dec, codes in catalog.chunks():
+            rows = np.zeros(len(ra), dtype)
+            rows['ra'] = ra
+            rows['dec'] = dec
+            if codes is not None:
+                rows['code'] = codes
+            rows.tofile(fp)
+            nrows += len(rows)
+    _replace(temporary, datafile)
+    meta = {'source': os.path.abspath(catalog.filename),
+            'nrows': nrows,
+            'types': catalog.has_types,
+            'categories': catalog.categories}
+    _write_atomic(metafile, json.dumps(meta).encode('utf-8'))
+
+
+def evict_cache(cachedir=CACHE_DIR, budget=CACHE_BUDGET, keep=()):
+    '''Removes the least recently used parsed catalogs of cachedir until
+    they take at most budget bytes. The entries named in keep are never
+    removed, even if they alone exceed the budget'''
+    entries = []
+    total = 0
+    for name in os.listdir(cachedir):
+        if not name.endswith('.json') or name == 'index.json':
+            continue
+        metafile = os.path.join(cachedir, name)
+        files = [metafile, _cache_data(metafile)]
+        size = sum(os.path.getsize(x) for x in files if os.path.exists(x))
+        # a hit touches the entry, so this is the time of the last use
+        entries.append((os.path.getmtime(metafile), name[:-5], files, size))
+        total += size
+
+    for used, key, files, size in sorted(entries):
+        if total <= budget:
+            break
+        if key in keep:
+            continue
+        for x in files:
+            if os.path.exists(x):
+                os.remove(x)
+        total -= size
+
+
+def cached_catalog(filename, chunksize=CHUNKSIZE, cachedir=CACHE_DIR,
+                   budget=CACHE_BUDGET):
+    '''Text source list read from its parsed copy in cachedir, a
+    CachedCatalog, after parsing it there if this content was never parsed.
+    The least recently used copies are then evicted to keep cachedir within
+    budget bytes. A file that is not a source list of at least two columns
+    is returned as a plain SourceCatalog'''
+    if not os.path.exists(cachedir):
+        os.makedirs(cachedir, mode=0o0755)
+
+    key = _content_key(filename, cachedir)
+    metafile = os.path.join(cachedir, key + '.json')
+    if os.path.exists(metafile) and os.path.exists(_cache_data(metafile)):
+        os.utime(metafile, None)
+    else:
+        catalog = SourceCatalog(filename, chunksize)
+        if catalog.ncolumns < 2:
+            return catalog
+        print('parsing ' + filename + ' into the catalog cache')
+        _store_catalog(catalog, metafile)
+
+    evict_cache(cachedir, budget, keep=(key,))
+    catalog = CachedCatalog(metafile, chunksize=chunksize)
+    catalog.filename = filename
+    return catalog
@@ -6,6 +6,21 @@ default_config = dict(
     cat_name='',
     out_dir='/Users/change-me/',
     #
+    # MB of parsed source lists kept in ~/.jwst_footprints/cache, 0 to
+    # parse the source list on every run
+    #
+    cache_budget=2048,
+    #
+    # also write the DS9 region files to out_dir ("Yes") or only send them
+    # to DS9 ("No")
+    #
+    region_files="Yes",
+    #
+    # also write the apertures containing every source to
+    # out_dir/sources-coverage.txt ("Yes"), reading the source list twice
+    #
+    source_coverage="No",
+    #
     # to plot or not to plot ?
     #
     plot_names=['plot'],
@@ -22,6 +37,16 @@ default_config = dict(
     color_short='Green',
     color_long='Blue',
     #
+    # source regions per source type (third column of the source list):
+    # color, shape (circle, box, diamond, cross, x, arrow, boxcircle) and
+    # radius in pixels; '*' applies to the types not listed
+    #
+    source_styles={
+        '*': {'color': 'yellow', 'shape': 'circle', 'radius': 5},
+        'F': {'color': 'yellow', 'shape': 'circle', 'radius': 5},
+        'P': {'color': 'red', 'shape': 'circle', 'radius': 5},
+    },
+    #
     # fiducial point equatorial coordinates
     # in degrees
     #
@@ -43,5 +68,12 @@ default_config = dict(
     cmap='grey',    # grey, red, green, blue, heat
     lim_min=0.0,
     lim_max=100.0,
-    scale='log'     # linear, log, power, squared
+    scale='log',    # linear, log, power, squared
+    #
+    # display: "ds9", or "png" to draw the image and the regions to
+    # out_dir/footprints.png without DS9 (e.g. without an X server), the
+    # image decimated to png_size pixels at most on a side
+    #
+    display_backend='ds9',
+    png_size=2048,
 )
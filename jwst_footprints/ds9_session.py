@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+A connection to DS9 kept for the whole process.
+
+DS9Session remembers what every frame of DS9 shows: the image, its display
+settings and the regions of every region file sent. show() only sends what
+changed, so a new position angle on an image already loaded costs a few
+XPA calls: the image is not read again and only the regions whose text
+changed are replaced. The regions of a region file are tagged with its
+name, so that they are deleted as a group; regions drawn by hand stay.
+
+pyds9 is only imported when DS9 is first used.
+"""
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import os
+import re
+from collections import OrderedDict
+
+
+def image_state(inputfile):
+    '''Name, size and modification time of the file of an image named as
+    file.fits or file.fits[1], which change when the file is rewritten'''
+    filename = re.sub(r'\[[^]]*\]$', '', inputfile)
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return (inputfile, None, None)
+    return (inputfile, stat.st_size, stat.st_mtime)
+
+
+def region_group(regionfile):
+    '''DS9 group (tag) of the regions of a region file'''
+    name = os.path.splitext(os.path.basename(regionfile))[0]
+    return re.sub(r'[^\w.+-]', '_', name)
+
+
+def tag_regions(text, group):
+    '''Region text with every region tagged with group'''
+    return text.replace(' # ', ' # tag={' + group + '} ')
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class DS9Session(object):
+    """
+    One DS9 and what its frames show: per frame, the image loaded, the
+    display settings applied and a digest of the text of every group of
+    regions sent. The connection is made on first use, and again, with
+    everything sent anew, when DS9 was closed.
+    """
+
+    def __init__(self):
+        self.ds9 = None
+        self.frames = []
+
+    def connect(self):
+        '''The pyds9.DS9 of the session'''
+        import pyds9
+
+        if self.ds9 is not None:
+            try:
+                self.ds9.get('frame')
+                return self.ds9
+            except ValueError:
+                # DS9 was closed, with everything it showed
+                self.ds9 = None
+
+        # Start xpans prior to running DS9
+        pyds9.ds9_xpans()
+
+        # Run DS9
+        self.ds9 = pyds9.DS9()
+        self.ds9.set('tile yes')
+        self.frames = []
+        return self.ds9
+
+    def show(self, frames, ds9cmap='grey', ds9limmin=0.0, ds9limmax=30.0,
+             ds9scale='log'):
+        '''Displays images and regions, one frame per (image, list of
+        RegionText) of frames, sending only what differs from what DS9
+        shows. The frames left over from a previous call are deleted'''
+        d = self.connect()
+        settings = [('cmap', ds9cmap),
+                    ('scale limits', '{} {}'.format(ds9limmin, ds9limmax)),
+                    ('scale', ds9scale)]
+
+        for frame, (inputfile, regions) in enumerate(frames):
+            if frame == len(self.frames):
+                self.frames.append({'image': None, 'settings': {},
+                                    'regions': OrderedDict()})
+            state = self.frames[frame]
+            d.set('frame {}'.format(frame + 1))
+
+            image = image_state(inputfile)
+            reload = image != state['image']
+            for name, value in settings:
+                if reload or state['settings'].get(name) != value:
+                    d.set('{} {}'.format(name, value))
+                    state['settings'][name] = value
+            if reload:
+                d.set('file ' + inputfile)
+                state['image'] = image
+                # DS9 deletes the regions of the previous image
+                state['regions'] = OrderedDict()
+
+            # replace the groups of regions whose text changed
+            sent = state['regions']
+            groups = OrderedDict()
+            texts = []
+            for region in regions:
+                group = region_group(region.name)
+                text = region.getvalue()
+                groups[group] = _digest(text)
+                if sent.get(group) != groups[group]:
+                    texts.append(tag_regions(text, group))
+            for group in sent:
+                if sent[group] != groups.get(group):
+                    d.set('regions group {} delete'.format(group))
+            if texts:
+                d.set('regions', ''.join(texts))
+            state['regions'] = groups
+
+        for frame in range(len(self.frames), len(frames), -1):
+            d.set('frame {}'.format(frame))
+            d.set('frame delete')
+        del self.frames[len(frames):]
+
+
+# the session of the process, see ds9_session()
+_session = None
+
+
+def ds9_session():
+    '''The DS9Session shared by the whole process'''
+    global _session
+    if _session is None:
+        _session = DS9Session()
+    return _session
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Footprints in formats read by tools other than DS9: STC-S, GeoJSON, astropy
+regions and HEALPix Multi-Order Coverage maps (MOC).
+
+Every writer takes the FOOTPRINT_DTYPE records of compute_footprints() and
+works from their ra, dec vertex arrays, so none of them needs an image.
+EXPORT_FORMATS maps a format name to its writer and file extension; a new
+format is added by adding an entry.
+
+The astropy regions and MOC formats need the optional regions and mocpy
+packages (pip install jwst_footprints[export]); their writers raise
+ImportError without them, and check_formats() tells beforehand.
+"""
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+from astropy.coordinates import SkyCoord
+
+from .regions import SKY_PRECISION, format_rows
+
+try:
+    from regions import PolygonSkyRegion, Regions
+except ImportError:
+    Regions = None
+
+try:
+    from mocpy import MOC
+except ImportError:
+    MOC = None
+
+# order of the smallest cells of the MOC (~3.2 arcsec)
+MOC_ORDER = 16
+
+# instrument colors of the astropy regions
+EXPORT_COLORS = {'long': 'blue', 'short': 'green', 'msa': 'red'}
+
+
+def _number(precision):
+    return '%.{}f'.format(precision)
+
+
+def write_stcs(footprints, outputfile, precision=SKY_PRECISION):
+    '''Writes the aperture polygons as STC-S, one Polygon ICRS region per
+    line'''
+    nvertices = footprints['ra'].shape[1] - 1
+    number = _number(precision)
+    layout = ('Polygon ICRS ' + ' '.join([number + ' ' + number] * nvertices) +
+              '\n')
+    values = np.empty((len(footprints), nvertices, 2))
+    # the last vertex closes the polygon and is implicit in STC-S
+    values[..., 0] = footprints['ra'][:, :-1]
+    values[..., 1] = footprints['dec'][:, :-1]
+    with open(outputfile, 'w') as fp:
+        fp.write(format_rows(layout, values.reshape(len(footprints), -1)))
+    return outputfile
+
+
+def _ccw(ring):
+    '''ring (a list of [lon, lat]) running counterclockwise'''
+    lon, lat = np.array(ring).T
+    if (lon[:-1] * lat[1:] - lon[1:] * lat[:-1]).sum() < 0.0:
+        return ring[::-1]
+    return ring
+
+
+def antimeridian_rings(lon, lat):
+    '''Closed rings of the polygon of vertices lon, lat (degrees, lon in
+    [-180, 180), the last vertex closing it), split where its edges cross
+    the antimeridian as RFC 7946 asks. A polygon around a pole is closed
+    along the antimeridian and the pole. Returns a list of lists of
+    [lon, lat]'''
+    pieces = [[]]
+    for i in range(len(lon) - 1):
+        pieces[-1].append([lon[i], lat[i]])
+        if abs(lon[i + 1] - lon[i]) <= 180.0:
+            continue
+        # the crossing, interpolated along the edge unwrapped across it
+        edge = 180.0 if lon[i] > 0.0 else -180.0
+        t = (edge - lon[i]) / (lon[i + 1] + 2.0 * edge - lon[i])
+        crossing = lat[i] + t * (lat[i + 1] - lat[i])
+        pieces[-1].append([edge, crossing])
+        pieces.append([[-edge, crossing]])
+    if len(pieces) == 1:
+        return [pieces[0] + pieces[0][:1]]
+
+    # the piece the ring starts in the middle of
+    pieces[0] = pieces.pop() + pieces[0]
+    if len(pieces) == 1:
+        ring = pieces[0]
+        pole = 90.0 if np.mean(lat) > 0.0 else -90.0
+        return [ring + [[ring[-1][0], pole], [ring[0][0], pole], ring[0]]]
+    return [piece + piece[:1] for piece in pieces]
+
+
+def write_geojson(footprints, outputfile, precision=SKY_PRECISION):
+    '''Writes the aperture polygons as a GeoJSON FeatureCollection, one
+    Feature per aperture with its instrument, aperture, dither and tile as
+    properties. The longitude is the ra wrapped to [-180, 180) and the
+    rings run counterclockwise; an aperture crossing the antimeridian is a
+    MultiPolygon of its pieces on either side'''
+    features = []
+    for record in footprints:
+        lon = (record['ra'] + 180.0) % 360.0 - 180.0
+        rings = []
+        for ring in antimeridian_rings(lon, record['dec']):
+            rings.append(_ccw([[round(float(a), precision),
+                                round(float(b), precision)]
+                               for a, b in ring]))
+        if len(rings) == 1:
+            geometry = {'type': 'Polygon', 'coordinates': rings}
+        else:
+            geometry = {'type': 'MultiPolygon',
+                        'coordinates': [[ring] for ring in rings]}
+        features.append({
+            'type': 'Feature',
+            'geometry': geometry,
+            'properties': {'instrument': str(record['instrument']),
+                           'aperture': str(record['aperture']),
+                           'dither': int(record['dither']),
+                           'tile': int(record['tile'])}})
+    with open(outputfile, 'w') as fp:
+        json.dump({'type': 'FeatureCollection', 'features': features}, fp)
+    return outputfile
+
+
+def footprint_sky_regions(footprints):
+    '''The aperture polygons as astropy regions, a Regions list of
+    PolygonSkyRegion labelled with their aperture (needs the regions
+    package)'''
+    if Regions is None:
+        raise ImportError('writing astropy regions needs the regions package')
+    polygons = []
+    for record in footprints:
+        polygon = PolygonSkyRegion(
+            vertices=SkyCoord(record['ra'][:-1], record['dec'][:-1],
+                              unit='deg', frame='icrs'))
+        polygon.meta['text'] = str(record['aperture'])
+        polygon.visual['color'] = EXPORT_COLORS.get(
+            str(record['instrument']), 'green')
+        polygons.append(polygon)
+    return Regions(polygons)
+
+
+def write_astropy_regions(footprints, outputfile, format=None):
+    '''Writes the aperture polygons with the regions package, in its format
+    format or, by default, the one of the file extension (.reg for DS9,
+    .crtf for CASA regions)'''
+    if format is None:
+        extension = os.path.splitext(outputfile)[1].lower()
+        format = {'.crtf': 'crtf'}.get(extension, 'ds9')
+    footprint_sky_regions(footprints).write(outputfile, format=format,
+                                            overwrite=True)
+    return outputfile
+
+
+def footprint_moc(footprints, order=MOC_ORDER):
+    '''mocpy MOC of the aperture polygons of FOOTPRINT_DTYPE records: the
+    union of the cells of order overlapping any of them (needs the mocpy
+    package)'''
+    if MOC is None:
+        raise ImportError('writing MOCs needs the mocpy package')
+    if len(footprints) == 0:
+        return MOC.new_empty(order)
+    # lon, lat of every polygon in turn, without the closing vertex
+    vertices = np.empty((2 * len(footprints), footprints['ra'].shape[1] - 1))
+    vertices[0::2] = footprints['ra'][:, :-1]
+    vertices[1::2] = footprints['dec'][:, :-1]
+    mocs = MOC.from_polygons(vertices, max_depth=order)
+    return mocs[0].union(*mocs[1:])
+
+
+def write_footprint_moc(footprints, outputfile, order=MOC_ORDER):
+    '''Writes the MOC of the aperture polygons, see footprint_moc, as a
+    FITS MOC or, for a .json file, in the JSON serialization'''
+    format = 'fits'
+    if os.path.splitext(outputfile)[1].lower() == '.json':
+        format = 'json'
+    footprint_moc(footprints, order).save(outputfile, format=format,
+                                          overwrite=True)
+    return outputfile
+
+
+# writer and file extension of every export format
+EXPORT_FORMATS = OrderedDict([
+    ('stcs', (write_stcs, '.stcs')),
+    ('geojson', (write_geojson, '.geojson')),
+    ('regions', (write_astropy_regions, '.reg')),
+    ('moc', (write_footprint_moc, '.moc.fits')),
+])
+
+
+# optional package of the formats that need one
+EXPORT_PACKAGES = {'regions': 'regions', 'moc': 'mocpy'}
+
+
+def check_formats(formats):
+    '''Raises ValueError if a name of formats is not in EXPORT_FORMATS and
+    ImportError if a format needs an optional package that is missing, so
+    that callers can check before writing anything'''
+    unknown = [x for x in formats if x not in EXPORT_FORMATS]
+    if unknown:
+        raise ValueError('unknown export formats ' + ', '.join(unknown))
+    imported = {'regions': Regions, 'moc': MOC}
+    missing = [x for x in formats
+               if x in EXPORT_PACKAGES and imported[x] is None]
+    if missing:
+        raise ImportError(
+            'export formats {} need the {} packages: pip install '
+            'jwst_footprints[export]'.format(
+                ', '.join(missing),
+                ', '.join(EXPORT_PACKAGES[x] for x in missing)))
+
+
+def export_footprints(footprints, outdir, formats=('stcs', 'geojson'),
+                      basename='footprints'):
+    '''Writes the FOOTPRINT_DTYPE records in every format of formats
+    (names of EXPORT_FORMATS) to outdir/<basename><extension>.
+    Returns the list of files written'''
+    check_formats(formats)
+    if not os.path.exists(outdir):
+        os.makedirs(outdir, mode=0o0755)
+
+    files = []
+    for name in formats:
+        writer, extension = EXPORT_FORMATS[name]
+        files.append(writer(footprints,
+                            os.path.join(outdir, basename + extension)))
+    return files
@@ -2,7 +2,6 @@
 from __future__ import absolute_import, division, print_function
 
 import os
-import sys
 import math
 
 from . import ephemeris_old2x as EPH
@@ -86,7 +85,10 @@ def allowed_max_vehicle_roll(sun_ra, sun_dec, ra, dec):
     return max_vehicle_roll
 
 
-def rollangle(ra, dec, outdir):
+def rollangle(ra, dec, outdir, v3pa=None):
+    """Writes the allowed V3 PA ranges of NIRCam and NIRSpec per day to
+    outdir/v3pa_nircam_nirspec.txt; v3pa (degrees), if given, is the
+    attitude the visibility windows are checked for"""
     NRCALL_FULL_V2IdlYang = -0.0265
     NRS_FULL_MSA_V3IdlYang = 137.4874
     NIS_V3IdlYang = -0.57
@@ -112,8 +114,8 @@ def rollangle(ra, dec, outdir):
     ra = float(ra) * D2R
     dec = float(dec) * D2R
 
-    if len(sys.argv) > 3:
-        pa = float(sys.argv[3]) * D2R
+    if v3pa is not None:
+        pa = float(v3pa) * D2R
     # print "Checked interval [%f,%f] MJD" % (search_start,search_start+span)
     if pa == "X":
         iflag_old = A_eph.in_FOR(search_start, ra, dec)
@@ -292,3 +294,25 @@ def rollangle(ra, dec, outdir):
                     tgt_is_in = False
 
     return ra, dec
+
+
+def allowed_v3pa(ra, dec, mjd, A_eph=None):
+    """Range (min, max) of the V3 PA in degrees allowed on the date mjd for a
+    target at ra, dec in degrees, as listed by rollangle, or None when the
+    target is out of the field of regard. A_eph is an optional Ephemeris to
+    reuse for several calls"""
+    if A_eph is None:
+        A_eph = EPH.Ephemeris(os.path.join(
+            PKG_DATA_DIR, "horizons_EM_L2_wrt_Sun_2018_2022.txt"), False)
+
+    ra = float(ra) * D2R
+    dec = float(dec) * D2R
+    if not A_eph.in_FOR(mjd, ra, dec):
+        return None
+
+    V3PA = A_eph.normal_pa(mjd, ra, dec) * R2D
+    (sun_ra, sun_dec) = A_eph.sun_pos(mjd)
+    max_boresight_roll = allowed_max_vehicle_roll(
+        sun_ra, sun_dec, ra, dec) * R2D
+    return (bound_angle(V3PA - max_boresight_roll),
+            bound_angle(V3PA + max_boresight_roll))
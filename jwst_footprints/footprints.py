@@ -30,16 +30,26 @@ from __future__ import absolute_import, division, print_function
 
 import sys
 import os
+import re
 import numpy as np
 
+from collections import OrderedDict
+
 from math import *
-from astropy import wcs
-from astropy.io import fits
-from astropy.io import ascii
 from astropy import units as u
 from astropy.coordinates import SkyCoord
-import pyds9
 from . import PKG_DATA_DIR
+from .image_wcs import ImageWCS, image_chips
+from .apertures import APERTURES, NVERTICES, unit
+from .coverage import (catalog_membership, depth_maps, polygon_edges,
+                       source_vectors)
+from .catalog import open_catalog
+from .ds9_session import ds9_session
+from .png_render import PNG_SIZE, render_frames
+from .export import check_formats, export_footprints
+from .regions import (RegionText, format_rows, polygon_regions,
+                      region_header, shape_layout, shape_regions,
+                      system_format)
 
 #readfitsimage = True
 #self.readfitsimageVar = StringVar()
@@ -53,41 +63,35 @@ def arcsec2deg(ra, dec, v2arcsec, v3arcsec, xr, yr):
     return (v2deg, v3deg)
 
 
-def unit(ra, dec):
-    ''' Converts vector expressed in Euler angles to unit vector components.
-    ra and dec in degrees
-    Can be used for V2V3 after converting from arcsec to degrees)'''
-
-    rar = radians(ra)
-    decr = radians(dec)
-    u = np.array([cos(rar) * cos(decr), sin(rar) * cos(decr), sin(decr)])
-    return u
-
-
 def radec(u):
     '''convert unit vector to Euler angles
-    u is an array or list of length 3'''
+    u is an array or list of length 3, or an array of shape (3, ...)
+    holding many vectors'''
 
     if len(u) != 3:
         print('Not a vector')
         return
-    norm = sqrt(u[0]**2 + u[1]**2 + u[2]**2)  # Works for list or array
-    dec = degrees(asin(u[2] / norm))
-    ra = degrees(atan2(u[1], u[0]))  # atan2 puts it in the correct quadrant
-    if ra < 0.0:
-        ra += 360.0    # Astronomers prefer the range 0 to 360 degrees
+    u = np.asarray(u, np.float64)
+    norm = np.sqrt(u[0]**2 + u[1]**2 + u[2]**2)  # Works for list or array
+    dec = np.degrees(np.arcsin(u[2] / norm))
+    # arctan2 puts it in the correct quadrant
+    ra = np.degrees(np.arctan2(u[1], u[0]))
+    # Astronomers prefer the range 0 to 360 degrees
+    ra = ra + 360.0 * (ra < 0.0)
     return (ra, dec)
 
 
 def v2v3(u):
-    '''Convert unit vector to v2v3'''
+    '''Convert unit vector to v2v3
+    u is an array or list of length 3, or an array of shape (3, ...)'''
     if len(u) != 3:
         print('Not a vector')
         return
-    norm = sqrt(u[0]**2 + u[1]**2 + u[2]**2)  # Works for list or array
-    # atan2 puts it in the correct quadrant
-    v2 = 3600 * degrees(atan2(u[1], u[0]))
-    v3 = 3600 * degrees(asin(u[2] / norm))
+    u = np.asarray(u, np.float64)
+    norm = np.sqrt(u[0]**2 + u[1]**2 + u[2]**2)  # Works for list or array
+    # arctan2 puts it in the correct quadrant
+    v2 = 3600 * np.degrees(np.arctan2(u[1], u[0]))
+    v3 = 3600 * np.degrees(np.arcsin(u[2] / norm))
     return (v2, v3)
 
 
@@ -135,6 +139,56 @@ def attitude(v2, v3, ra, dec, pa):
     return m
 
 
+def attitudes(v2, v3, ra, dec, pa):
+    '''Vectorized version of attitude: v2, v3 (arcsec), ra, dec and pa
+    (degrees) are scalars or arrays that broadcast against each other.
+    Returns a stack of rotation matrices of shape (N, 3, 3).
+
+    The product mra*mdec*mpa*mv3*mv2 is written out in closed form, split as
+    (mra*mdec*mpa) * (mv3*mv2) so that no rotate() calls are needed'''
+
+    v2, v3, ra, dec, pa = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(x, np.float64)).ravel()
+          for x in (v2, v3, ra, dec, pa)])
+
+    cv2 = np.cos(np.radians(v2 / 3600.0))
+    sv2 = np.sin(np.radians(v2 / 3600.0))
+    cv3 = np.cos(np.radians(v3 / 3600.0))
+    sv3 = np.sin(np.radians(v3 / 3600.0))
+    cra = np.cos(np.radians(ra))
+    sra = np.sin(np.radians(ra))
+    cdec = np.cos(np.radians(dec))
+    sdec = np.sin(np.radians(dec))
+    cpa = np.cos(np.radians(pa))
+    spa = np.sin(np.radians(pa))
+
+    # sky part mra*mdec*mpa, filled column by column
+    a = np.empty((len(v2), 3, 3))
+    a[:, 0, 0] = cra * cdec
+    a[:, 1, 0] = sra * cdec
+    a[:, 2, 0] = sdec
+    a[:, 0, 1] = -sra * cpa + spa * cra * sdec
+    a[:, 1, 1] = cra * cpa + spa * sra * sdec
+    a[:, 2, 1] = -spa * cdec
+    a[:, 0, 2] = -sra * spa - cpa * cra * sdec
+    a[:, 1, 2] = cra * spa - cpa * sra * sdec
+    a[:, 2, 2] = cpa * cdec
+
+    # telescope part mv3*mv2
+    b = np.empty((len(v2), 3, 3))
+    b[:, 0, 0] = cv3 * cv2
+    b[:, 0, 1] = cv3 * sv2
+    b[:, 0, 2] = sv3
+    b[:, 1, 0] = -sv2
+    b[:, 1, 1] = cv2
+    b[:, 1, 2] = 0.0
+    b[:, 2, 0] = -sv3 * cv2
+    b[:, 2, 1] = -sv3 * sv2
+    b[:, 2, 2] = cv3
+
+    return np.matmul(a, b)
+
+
 def pointing(attitude, v2, v3):
     '''Using the attitude matrix to calculate where any v2v3 position points on the sky'''
     v2d = v2 / 3600.0
@@ -145,6 +199,26 @@ def pointing(attitude, v2, v3):
     return rd  # tuple containing ra and dec
 
 
+def pointings(attitude, v2, v3):
+    '''Batch version of pointing: v2 and v3 are arrays of positions in arcsec.
+    attitude is either a single 3x3 matrix or a stack of shape (N, 3, 3);
+    the returned ra and dec arrays have shape v2.shape or (N,) + v2.shape'''
+    v2d = np.asarray(v2, np.float64) / 3600.0
+    v3d = np.asarray(v3, np.float64) / 3600.0
+    v = unit(v2d, v3d).reshape(3, -1)
+    ra, dec = vector_pointings(attitude, v)
+    shape = np.shape(attitude)[:-2] + np.shape(v2d)
+    return (ra.reshape(shape), dec.reshape(shape))
+
+
+def vector_pointings(attitude, v):
+    '''pointings of precomputed unit vectors v of shape (3, M), e.g. the
+    vectors of an ApertureTable; returns arrays of shape (M,) or (N, M)'''
+    w = np.matmul(attitude, v)
+    # move the vector axis first so that radec sees shape (3, ...)
+    return radec(np.moveaxis(w, -2, 0))
+
+
 def linear_transformation(theta, xshift, yshift,
                           xscale, yscale, x2, x3, xr, yr):
     th = radians(theta)
@@ -245,93 +319,67 @@ def rotate_short(x2, x3, theta):
 #------------------------------
 
 
-def create_footprint(inputfile, ra, dec, napertures, footprintname, color):
-    global w
+def create_footprint(image, ra, dec, napertures, footprintname, color,
+                     system='image'):
     # input
 
+    # image = ImageWCS of the image the regions are drawn on
     # ra = ra in degrees
     # dec = dec in degrees
     # footprintname is the name of the output file
     # napertures = number of apertures in footprint ( Nircam LONG = 2, NIRCam
     # short = 8, MSA = 4)
-
-    nrows = napertures * 5
-    # print(nrows)
-    ra = np.array(ra, np.float_)  # np.array(ra, np.float_)
-    dec = np.array(dec, np.float_)  # np.array(dec, np.float_)
-    world = []
-    # print ra
-    #sys.exit("quitting now...")
-
-    for i in range(0, nrows):
-        #world = np.append(world,(ra[i],dec[i]))
-        world.append((ra[i], dec[i]))
-    pixcrd2 = w.wcs_world2pix(world, 1)
-    xx = []
-    yy = []
-    for i in range(0, nrows):
-        xx.append(pixcrd2[[i], 0])
-        yy.append(pixcrd2[[i], 1])
-        #xx = np.append(xx,pixcrd2[[i],0])
-        #yy = np.append(yy,pixcrd2[[i],1])
-
-    xwcs = np.array(xx, np.float_)
-    ywcs = np.array(yy, np.float_)
-    x = [float(i) for i in xwcs]
-    y = [float(i) for i in ywcs]
-    # print x
-    # polygon x1 y1 x2 y2 x3 y3 ...
-
-    outputfile = footprintname
-    file = open(outputfile, "w")
-    file.write(
-        'global color=' +
-        color +
-        ' width=1 font="helvetica 15 normal roman"   select=0 highlite=1 \n')
-    file.write('image\n')
-    pos = 0
-    for i in range(0, napertures):
-        newline = 'polygon ' + str(x[pos]) + '  ' + str(y[pos]) + '  ' + str(x[pos + 1]) + '  ' + str(y[pos + 1]) + '  ' + str(x[pos + 2]) + '  ' + str(
-            y[pos + 2]) + '  ' + str(x[pos + 3]) + '  ' + str(y[pos + 3]) + '  ' + str(x[pos + 4]) + '  ' + str(y[pos + 4]) + '  ' + '# text={}' + '\n'
-        file.write(newline)
-        pos = pos + 5
-    file.close()
+    # system = coordinate system of the regions, image or fk5/icrs (then
+    # image is not used)
+
+    with open(footprintname, 'w') as file:
+        file.write(footprint_text(image, ra, dec, napertures, color, system))
+
+
+def footprint_text(image, ra, dec, napertures, color, system='image'):
+    '''Region text of create_footprint'''
+    nrows = napertures * NVERTICES
+    ra = np.array(ra, np.float_)[:nrows]
+    dec = np.array(dec, np.float_)[:nrows]
+    precision, _ = system_format(system)
+    if system == 'image':
+        x, y = image.world2pix(ra, dec)
+    else:
+        x, y = ra, dec
+
+    # polygon(x1,y1,x2,y2,x3,y3,...) per aperture
+    return (region_header(color, system) +
+            polygon_regions(x.reshape(napertures, NVERTICES),
+                            y.reshape(napertures, NVERTICES),
+                            precision))
 #------------------------------
 
 
 #------------------------------
-def create_footprint_center(inputfile, ra, dec, footprintname, color):
-    global w
-
+def create_footprint_center(image, ra, dec, footprintname, color,
+                            system='image'):
     '''
+    # image = ImageWCS of the image the regions are drawn on
     # ra = ra in degrees
     # dec = dec in degrees
     # footprintname is the name of the output file
-    # napertures = number of apertures in footprint ( Nircam LONG = 2, NIRCam
-    # short = 8, MSA = 4)
+    # system = coordinate system of the region, image or fk5/icrs
     '''
-    ra = np.array(ra, np.float_)
-    dec = np.array(dec, np.float_)
-    world = []
-    world.append((ra, dec))
-    pixcrd2 = w.wcs_world2pix(world, 1)
-    xx = float(pixcrd2[[0], 0])
-    yy = float(pixcrd2[[0], 1])
-    c2 = "%10s" % str(xx)
-    c3 = "%10s" % str(yy)
-
-    # polygon x1 y1 x2 y2 x3 y3 ...
-
-    outputfile = footprintname
-    file = open(outputfile, "w")
-    file.write(
-        'global color=' +
-        color +
-        ' width=1 font="helvetica 15 normal roman"  select=0 highlite=1 \n')
-    file.write('image\n')
-    newline = 'point(' + c2 + ',' + c3 + ') # point=cross 20  \n'
-    file.write(newline)
-    file.close()
+    with open(footprintname, 'w') as file:
+        file.write(footprint_center_text(image, ra, dec, color, system))
+
+
+def footprint_center_text(image, ra, dec, color, system='image'):
+    '''Region text of create_footprint_center'''
+    x = np.array([ra], np.float_)
+    y = np.array([dec], np.float_)
+    precision, _ = system_format(system)
+    if system == 'image':
+        x, y = image.world2pix(x, y)
+
+    return (region_header(color, system) +
+            shape_regions(x, y, shape='cross', radius=20,
+                          precision=precision))
 
 #------------------------------
 
@@ -346,6 +394,471 @@ def read_table(inputfile, delim=' '):
     return list(zip(*records))
 
 
+def read_vertices(instrument):
+    '''V2, V3 (arcsec) of the aperture vertices of an instrument footprint'''
+    aperture = APERTURES[instrument]
+    return (aperture.v2, aperture.v3)
+
+
+def read_dither_patterns(inputfile=os.path.join(PKG_DATA_DIR,
+                                                'dither-patterns.txt')):
+    '''Reads the dither pattern registry.
+    Every row holds pattern name, region file suffix, anchor and the V2, V3
+    offsets (arcsec) of one pattern position. The anchor is the instrument
+    whose rotation reference point the offsets are measured from, or 'self'
+    for the instrument being dithered'''
+    names, suffixes, anchors, dv2, dv3 = read_table(inputfile)
+    patterns = OrderedDict()
+    for name, suffix, anchor, x, y in zip(names, suffixes, anchors, dv2, dv3):
+        pattern = patterns.setdefault(
+            name, {'suffix': suffix, 'anchor': anchor, 'offsets': []})
+        pattern['offsets'].append((float(x), float(y)))
+    for pattern in patterns.values():
+        pattern['offsets'] = np.array(pattern['offsets'], np.float64)
+    return patterns
+
+
+DITHER_PATTERNS = read_dither_patterns()
+
+
+def dither_reference(instrument, pattern):
+    '''V2, V3 (arcsec) the offsets of a dither pattern are added to: the
+    rotation reference point of the anchor instrument, moved to the middle
+    of the extreme pattern positions'''
+    anchor = pattern['anchor']
+    if anchor == 'self':
+        anchor = instrument
+    xr, yr = APERTURES[anchor].reference
+    offsets = pattern['offsets']
+    middle = (offsets.min(axis=0) + offsets.max(axis=0)) / 2.0
+    return (xr + middle[0], yr + middle[1])
+
+
+def dither_footprints(instrument, ra, dec, pa, patterns=None):
+    '''Footprint of an instrument at every position of the given dither
+    patterns (names in DITHER_PATTERNS, all of them by default), with the
+    pattern reference point placed at ra, dec (degrees) and position angle pa.
+    The positions of all the patterns go through one stack of attitude
+    matrices and one product with the aperture vertices.
+    Returns an ordered dictionary name -> (ra, dec), each an array of shape
+    (number of positions, number of vertices)'''
+    if patterns is None:
+        patterns = list(DITHER_PATTERNS)
+
+    refv2 = []
+    refv3 = []
+    for name in patterns:
+        pattern = DITHER_PATTERNS[name]
+        xr, yr = dither_reference(instrument, pattern)
+        refv2.append(xr + pattern['offsets'][:, 0])
+        refv3.append(yr + pattern['offsets'][:, 1])
+
+    m = attitudes(np.concatenate(refv2), np.concatenate(refv3), ra, dec, pa)
+    myra, mydec = vector_pointings(m, APERTURES[instrument].vectors)
+    split = np.cumsum([len(x) for x in refv2])[:-1]
+    return OrderedDict(zip(patterns, zip(np.split(myra, split),
+                                         np.split(mydec, split))))
+
+
+def mosaic_tiles(instrument, shape, overlap=0.1):
+    '''V2, V3 offsets (arcsec) of the tile centres of a mosaic of
+    shape = (rows, columns) tiles, rows along V3 and columns along V2,
+    centred on the pointing. Neighbouring tiles overlap by the fraction
+    overlap of the instrument footprint extent.
+    Returns an array of shape (rows * columns, 2)'''
+    nrows, ncols = shape
+    v2, v3 = read_vertices(instrument)
+    step2 = (v2.max() - v2.min()) * (1.0 - overlap)
+    step3 = (v3.max() - v3.min()) * (1.0 - overlap)
+    row, col = np.mgrid[0:nrows, 0:ncols]
+    tiles = np.empty((nrows * ncols, 2))
+    tiles[:, 0] = ((col - (ncols - 1) / 2.0) * step2).ravel()
+    tiles[:, 1] = ((row - (nrows - 1) / 2.0) * step3).ravel()
+    return tiles
+
+
+def mosaic_footprints(instrument, ra, dec, pa, tiles, dither='None'):
+    '''Footprint of an instrument at every position of a dither pattern in
+    every mosaic tile. tiles holds the V2, V3 offsets (arcsec) of the tile
+    centres, e.g. from mosaic_tiles(). The telescope is offset to move each
+    tile, so the whole mosaic rotates with pa about the pointing ra, dec.
+    Returns ra and dec arrays of shape
+    (number of tiles, number of pattern positions, number of vertices)'''
+    vectors = APERTURES[instrument].vectors
+    pattern = DITHER_PATTERNS[dither]
+    xr, yr = dither_reference(instrument, pattern)
+
+    tiles = np.atleast_2d(np.asarray(tiles, np.float64))
+    # moving the footprint by +offset means moving the reference by -offset
+    refv2 = xr + pattern['offsets'][np.newaxis, :, 0] - tiles[:, np.newaxis, 0]
+    refv3 = yr + pattern['offsets'][np.newaxis, :, 1] - tiles[:, np.newaxis, 1]
+
+    m = attitudes(refv2.ravel(), refv3.ravel(), ra, dec, pa)
+    myra, mydec = vector_pointings(m, vectors)
+    shape = refv2.shape + (vectors.shape[1],)
+    return (myra.reshape(shape), mydec.reshape(shape))
+
+
+def pa_sweep(ra, dec, pas, instruments=('long', 'short', 'msa')):
+    '''Footprints of the selected instruments for every position angle in pas.
+    ra and dec (degrees) are placed on the rotation reference point of each
+    instrument, as in footprints().
+    Returns a dictionary instrument -> (ra, dec), each an array of shape
+    (len(pas), number of vertices)
+
+    The attitude matrix factors as mra*mdec*mpa*(mv3*mv2): the aperture unit
+    vectors are taken through mv3*mv2 once and only the rotation about the
+    V1 axis by the position angle is applied per slice.'''
+
+    pas = np.atleast_1d(np.asarray(pas, np.float64))
+    cpa = np.cos(np.radians(pas))[:, np.newaxis]
+    spa = np.sin(np.radians(pas))[:, np.newaxis]
+    # mra*mdec
+    sky = attitudes(0.0, 0.0, ra, dec, 0.0)[0]
+
+    sweep = {}
+    for instrument in instruments:
+        aperture = APERTURES[instrument]
+        xr, yr = aperture.reference
+
+        # vertices in the frame where the reference point is the V1 axis
+        x, y, z = np.dot(attitudes(xr, yr, 0.0, 0.0, 0.0)[0],
+                         aperture.vectors)
+        # mpa only mixes the y and z components
+        y, z = cpa * y + spa * z, cpa * z - spa * y
+        x = np.broadcast_to(x, y.shape)
+        w = np.tensordot(sky, np.array([x, y, z]), axes=1)
+        sweep[instrument] = radec(w)
+
+    return sweep
+
+
+def write_pa_sweep(sweep,
+                   pas,
+                   outdir,
+                   inputfile=None,
+                   npzfile=None,
+                   colors=None):
+    '''Writes the output of pa_sweep.
+    If inputfile is given, one DS9 region file per instrument and position
+    angle is written to outdir using the WCS of that image.
+    If npzfile is given, all the vertices are stored in a single compressed
+    numpy file with arrays pa, <instrument>_ra and <instrument>_dec.
+    colors maps an instrument to its region color; the instruments it
+    leaves out are drawn in green'''
+    if not os.path.exists(outdir):
+        os.makedirs(outdir, mode=0o0755)
+        print("creating directory " + outdir)
+
+    pas = np.atleast_1d(np.asarray(pas, np.float64))
+    if colors is None:
+        colors = {'long': 'blue', 'short': 'green', 'msa': 'red',
+                  'ifu': 'magenta'}
+
+    if inputfile is not None:
+        image = ImageWCS.from_file(inputfile)
+        for instrument, (ra, dec) in sweep.items():
+            napertures = ra.shape[1] // NVERTICES
+            for i, pa in enumerate(pas):
+                create_footprint(
+                    image,
+                    ra[i],
+                    dec[i],
+                    napertures,
+                    os.path.join(outdir, 'ds9-{}-pa{:07.3f}.reg'.format(
+                        instrument, pa)),
+                    colors.get(instrument, 'green'))
+
+    if npzfile is not None:
+        arrays = {'pa': pas}
+        for instrument, (ra, dec) in sweep.items():
+            arrays[instrument + '_ra'] = ra
+            arrays[instrument + '_dec'] = dec
+        np.savez_compressed(os.path.join(outdir, npzfile), **arrays)
+
+
+# style of the region files of every source type drawn by source_regions:
+# color, shape (circle, box or a DS9 point shape: diamond, cross, x, arrow,
+# boxcircle), radius in pixels and file name; '*' is the style of a list
+# without types and of the types not listed, drawn in
+# ds9-sources-<type>.reg
+SOURCE_STYLES = OrderedDict([
+    ('*', {'color': 'yellow', 'shape': 'circle', 'radius': 5,
+           'file': 'ds9-sources.reg'}),
+    ('F', {'color': 'yellow', 'shape': 'circle', 'radius': 5,     # fillers
+           'file': 'ds9-sources-fillers.reg'}),
+    ('P', {'color': 'red', 'shape': 'circle', 'radius': 5,        # primary
+           'file': 'ds9-sources-primary.reg'}),
+])
+
+
+def source_style(sourcetype, styles=SOURCE_STYLES):
+    '''Style of a source type (None for a list without types) from styles,
+    completed with the '*' style and with SOURCE_STYLES'''
+    style = dict(SOURCE_STYLES['*'])
+    style.update(styles.get('*', {}))
+    if sourcetype is None:
+        return style
+    style['file'] = 'ds9-sources-{}.reg'.format(
+        re.sub(r'[^\w.+-]', '_', sourcetype))
+    style.update(SOURCE_STYLES.get(sourcetype, {}))
+    style.update(styles.get(sourcetype, {}))
+    return style
+
+
+def _open_source_region(outdir, style, system, write, keep):
+    return RegionText(os.path.join(outdir, style['file']),
+                      region_header(style['color'], system), keep, write)
+
+
+def source_regions(catalog, images, outdirs, styles=None, system='image',
+                   write=True, keep=True):
+    '''Writes DS9 region files with a region around every source of a
+    SourceCatalog, projected with every ImageWCS of images into the matching
+    directory of outdirs. With a type column every source type goes to its
+    own file, drawn in its style of styles (SOURCE_STYLES by default); the
+    files of the listed types are written even if empty. The catalog is read
+    and projected chunk by chunk, each chunk once per image and then split
+    by type; with several images, a source is projected only on the images
+    whose sky cap contains it. With a sky coordinate system (fk5, icrs) the
+    sources are not projected: images is then [None] and the files are
+    written to outdirs[0]. With write false no file is written, with keep
+    false the text of the files is not kept in memory.
+    Returns, per image, the list of RegionText of its region files'''
+    if styles is None:
+        styles = SOURCE_STYLES
+    precision, radius_unit = system_format(system)
+
+    print('creating region file from source list')
+    if catalog.ncolumns < 2:
+        print('Invalid input file')
+        return [[] for image in images]
+
+    listed = [x for x in styles if x != '*'] if catalog.has_types else [None]
+    files = []
+    layouts = {}
+    try:
+        for outdir in outdirs:
+            handles = OrderedDict()
+            for sourcetype in listed:
+                handles[sourcetype] = _open_source_region(
+                    outdir, source_style(sourcetype, styles), system,
+                    write, keep)
+            files.append(handles)
+
+        for start, ra, dec, codes in catalog.chunks():
+            if len(images) > 1:
+                vectors = source_vectors(ra, dec)
+            for image, handles, outdir in zip(images, files, outdirs):
+                selected = slice(None)
+                if len(images) > 1:
+                    selected = np.nonzero(image.overlaps(vectors))[0]
+                if system == 'image':
+                    x, y = image.world2pix(ra[selected], dec[selected])
+                else:
+                    x, y = ra[selected], dec[selected]
+
+                # group the sources by type code
+                if codes is None:
+                    groups = [(None, slice(None))]
+                else:
+                    order = np.argsort(codes[selected], kind='stable')
+                    bounds = np.searchsorted(
+                        codes[selected][order],
+                        np.arange(len(catalog.categories) + 1))
+                    groups = [(catalog.categories[k],
+                               order[bounds[k]:bounds[k + 1]])
+                              for k in range(len(catalog.categories))
+                              if bounds[k + 1] > bounds[k]]
+
+                for sourcetype, these in groups:
+                    if sourcetype not in layouts:
+                        style = source_style(sourcetype, styles)
+                        layouts[sourcetype] = shape_layout(
+                            style['shape'], style['radius'], precision,
+                            radius_unit)
+                    if sourcetype not in handles:
+                        handles[sourcetype] = _open_source_region(
+                            outdir, source_style(sourcetype, styles), system,
+                            write, keep)
+                    handles[sourcetype].write(format_rows(
+                        layouts[sourcetype],
+                        np.column_stack([x[these], y[these]])))
+    finally:
+        for handles in files:
+            for fp in handles.values():
+                fp.close()
+
+    return [list(handles.values()) for handles in files]
+
+
+# one record per aperture polygon
+FOOTPRINT_DTYPE = [('instrument', 'U5'),
+                   ('aperture', 'U16'),
+                   ('dither', 'i4'),
+                   ('tile', 'i4'),
+                   ('ra', 'f8', (NVERTICES,)),
+                   ('dec', 'f8', (NVERTICES,))]
+
+
+def parse_radec(ra, dec):
+    '''Converts ra, dec given either in degrees or as hh mm ss.sss and
+    dd mm ss.sss strings to degrees'''
+    try:
+        # it recognizes that the string has the format   hh mm ss.sss
+        sexagesimal = (' ' in ra) and (' ' in dec)
+    except TypeError:
+        sexagesimal = False
+    if sexagesimal:
+        c = SkyCoord(ra + ' ' + dec, unit=(u.hourangle, u.deg))
+        return (c.ra.deg, c.dec.deg)
+    return (float(ra), float(dec))
+
+
+def aperture_names(instrument):
+    '''Names of the apertures of an instrument footprint, one per polygon'''
+    return APERTURES[instrument].names
+
+
+def footprint_records(instrument, ra, dec):
+    '''Packs the sky vertices of an instrument footprint, arrays of shape
+    (tiles, dither positions, vertices), into FOOTPRINT_DTYPE records'''
+    ntiles, npositions, nvertices = ra.shape
+    names = aperture_names(instrument)
+    records = np.zeros(ra.size // NVERTICES, dtype=FOOTPRINT_DTYPE)
+    records['instrument'] = instrument
+    records['aperture'] = np.tile(names, ntiles * npositions)
+    records['tile'] = np.repeat(np.arange(ntiles), npositions * len(names))
+    records['dither'] = np.tile(np.repeat(np.arange(npositions), len(names)),
+                                ntiles)
+    records['ra'] = ra.reshape(-1, NVERTICES)
+    records['dec'] = dec.reshape(-1, NVERTICES)
+    return records
+
+
+def compute_footprints(plot_long='No',
+                       plot_short='No',
+                       plot_msa='No',
+                       ra_long='202.47',
+                       dec_long='47.2',
+                       theta_long=0.0,
+                       dither_pattern_long='None',
+                       ra_msa='202.47',
+                       dec_msa='47.2',
+                       theta_msa=0.0,
+                       mosaic='No',
+                       usershiftv2=0.0,
+                       usershiftv3=0.0,
+                       mosaic_shape=None,
+                       mosaic_overlap=0.1):
+    '''Sky vertices of the selected footprints, without any file or display
+    I/O. The arguments have the same meaning as in footprints().
+    Returns a structured array with FOOTPRINT_DTYPE, one record per aperture
+    polygon: instrument ('long', 'short' or 'msa'), aperture name, dither
+    position index, mosaic tile index and the ra, dec of its vertices'''
+
+    records = []
+
+    if plot_msa == 'Yes':
+        ra, dec = parse_radec(ra_msa, dec_msa)
+        myra, mydec = dither_footprints('msa', ra, dec, theta_msa,
+                                        ['None'])['None']
+        records.append(footprint_records('msa', myra[np.newaxis],
+                                         mydec[np.newaxis]))
+
+    for instrument, plot in (('long', plot_long), ('short', plot_short)):
+        if plot != 'Yes':
+            continue
+        ra, dec = parse_radec(ra_long, dec_long)
+        if mosaic == 'Yes':
+            if mosaic_shape is None:
+                # the two tiles of the offset entries
+                usershiftv2 = float(usershiftv2)
+                usershiftv3 = float(usershiftv3)
+                tiles = [[-usershiftv2 / 2.0, -usershiftv3 / 2.0],
+                         [usershiftv2 / 2.0, usershiftv3 / 2.0]]
+            else:
+                # the two channels are exposed together: one grid of
+                # pointings, from the long wavelength extent, for both
+                tiles = mosaic_tiles('long', mosaic_shape, mosaic_overlap)
+            myra, mydec = mosaic_footprints(instrument, ra, dec, theta_long,
+                                            tiles, dither_pattern_long)
+        else:
+            myra, mydec = dither_footprints(
+                instrument, ra, dec, theta_long,
+                [dither_pattern_long])[dither_pattern_long]
+            myra = myra[np.newaxis]
+            mydec = mydec[np.newaxis]
+        records.append(footprint_records(instrument, myra, mydec))
+
+    if not records:
+        return np.zeros(0, dtype=FOOTPRINT_DTYPE)
+    return np.concatenate(records)
+
+
+def footprint_regions(footprints, image, outdir, names, colors, centres,
+                      system='image', write=True):
+    '''Writes the output of compute_footprints as DS9 region files projected
+    with the ImageWCS image: ds9-<instrument>-<name>.reg with the aperture
+    polygons (or
+    ds9-<instrument>.reg if the name is None) and ds9-<instrument>-centre.reg
+    with a cross at the pointing. names, colors and centres are
+    dictionaries keyed by instrument. With a sky coordinate system (fk5,
+    icrs) the regions are written in ra, dec and image may be None. With
+    write false no file is written.
+    Returns the list of RegionText of the region files, with their text'''
+
+    # verify that outdir exists
+    if write and not os.path.exists(outdir):
+        os.makedirs(outdir, mode=0o0755)
+        print("creating directory " + outdir)
+
+    regions = []
+    for instrument in ('long', 'short', 'msa'):
+        selected = footprints[footprints['instrument'] == instrument]
+        if len(selected) == 0:
+            continue
+        if names[instrument] is None:
+            regionfile = 'ds9-{}.reg'.format(instrument)
+        else:
+            regionfile = 'ds9-{}-{}.reg'.format(instrument, names[instrument])
+        centrefile = 'ds9-{}-centre.reg'.format(instrument)
+        ra, dec = centres[instrument]
+
+        texts = [(centrefile,
+                  footprint_center_text(image, ra, dec, colors[instrument],
+                                        system)),
+                 (regionfile,
+                  footprint_text(image,
+                                 selected['ra'].ravel(),
+                                 selected['dec'].ravel(),
+                                 len(selected),
+                                 colors[instrument],
+                                 system))]
+        for filename, text in texts:
+            with RegionText(os.path.join(outdir, filename), text,
+                            write=write) as region:
+                regions.append(region)
+
+    return regions
+
+
+# where footprints() displays the frames: DS9, or PNG files written without
+# any display
+DISPLAY_BACKENDS = ('ds9', 'png')
+
+
+def display(frames, ds9cmap='grey', ds9limmin=0.0, ds9limmax=30.0,
+            ds9scale='log'):
+    '''Displays images and regions in DS9, one frame per
+    (image, list of RegionText) of frames; an image can name an
+    extension as file.fits[1]. The region texts of a frame are sent
+    together, as the data of a single XPA command, not read from files.
+    DS9 stays connected between calls and only what changed since the
+    previous call is sent (see ds9_session)'''
+    ds9_session().show(frames, ds9cmap, ds9limmin, ds9limmax, ds9scale)
+
+
 def footprints(inputfile,
                sourcelist,
                plot_long='No',
@@ -355,7 +868,7 @@ def footprints(inputfile,
                ra_long='202.47',
                dec_long='47.2',
                theta_long=0.0,
-               dither_pattern_long='No',
+               dither_pattern_long='None',
                ra_msa='202.47',
                dec_msa='47.2',
                theta_msa=0.0,
@@ -369,869 +882,185 @@ def footprints(inputfile,
                ds9limmin=0.0,
                ds9limmax=30.0,
                ds9scale='log',
-               outdir='/Users/myname/Desktop/'):
-               # readfitsimage=True):
-
-    # verify that outdir exists
-    if not os.path.exists(outdir):
-        os.makedirs(outdir, mode=0o0755)
-        print("creating directory " + outdir)
-
-    # print(outdir)
-    global w
-
-    usershiftv2 = np.array(usershiftv2, np.float_)
-    usershiftv3 = np.array(usershiftv3, np.float_)
+               outdir='/Users/myname/Desktop/',
+               mosaic_shape=None,
+               mosaic_overlap=0.1,
+               coverage_map='No',
+               coverage_processes=1,
+               catalog_columns=None,
+               source_styles=None,
+               cache_budget=0,
+               region_system='image',
+               export_formats=(),
+               region_files='Yes',
+               display_backend='ds9',
+               png_size=PNG_SIZE,
+               source_coverage='No'):
+    '''Computes the selected footprints, writes them and the source list as
+    DS9 region files to outdir and displays them on top of inputfile. The
+    regions are sent to DS9 from memory; with region_files 'No' they are
+    only displayed, no region file is written.
+    sourcelist is a text ra dec [type] list or a FITS, NumPy or Parquet
+    table whose ra, dec [and type] columns are named by catalog_columns,
+    or found by name by default. The sources of every type are drawn in
+    their style of source_styles, SOURCE_STYLES by default. With a
+    cache_budget (bytes) a text source list is parsed once into the catalog
+    cache in ~/.jwst_footprints/cache, which keeps up to cache_budget bytes
+    of parsed lists; by default (0) nothing is cached and the text is read
+    every time.
+    When inputfile has several image extensions with a celestial WCS, every
+    chip the footprints can touch gets its own frame and its region files
+    in outdir/<EXTNAME><EXTVER>.
+    With coverage_map 'Yes' the number of exposures of every instrument on
+    every pixel of inputfile is also written to
+    outdir/coverage-depth-<instrument>.fits, computed on coverage_processes
+    processes.
+    With source_coverage 'Yes' the apertures containing every source of
+    the list are written to outdir/sources-coverage.txt, reading the list
+    a second time.
+    With region_system 'fk5' or 'icrs' the region files are written once,
+    to outdir, in ra, dec instead of the pixels of inputfile: nothing is
+    projected and they fit any image of the field. inputfile can then be
+    None, to only write the region files without displaying them.
+    The footprints are also exported to outdir in every format of
+    export_formats, names of export.EXPORT_FORMATS (stcs, geojson, regions,
+    moc).
+    With display_backend 'png' nothing is displayed: every frame is drawn,
+    with the same colormap, limits and scale, to outdir/footprints.png
+    (outdir/footprints-<EXTNAME><EXTVER>.png per chip), the image being
+    decimated to png_size pixels at most on a side'''
+
+    if display_backend not in DISPLAY_BACKENDS:
+        raise ValueError('unknown display backend ' + str(display_backend))
+    nircam = plot_long == 'Yes' or plot_short == 'Yes'
+    if nircam and dither_pattern_long not in DITHER_PATTERNS:
+        raise ValueError('unknown dither pattern ' + str(dither_pattern_long))
+    system_format(region_system)
+    check_formats(export_formats)
+    sky = region_system != 'image'
+    write = region_files == 'Yes'
+
+    # read the image headers: every image extension with a celestial WCS,
+    # e.g. the SCI extensions of the chips of a pipeline product
+    chips = []
+    if inputfile is not None:
+        chips = image_chips(inputfile)
+        if not chips:
+            raise ValueError(inputfile + ': no image with a celestial WCS')
+    elif not sky:
+        raise ValueError('image regions need an input image')
+    elif coverage_map == 'Yes':
+        raise ValueError('the coverage map needs an input image')
 
-    # nircam long footprint
-    ra_short = ra_long
-    dec_short = dec_long
-    theta_short = theta_long
-    dither_pattern_short = dither_pattern_long
-
-    # read image and its header
-    # need to extend this to multi extension fits files
-    # print(readfitsimage)
-    # print('reading fits')
-    hdulist = fits.open(inputfile)
-    w = wcs.WCS(hdulist[0].header)    # assuming WCS is in extension 0
-    '''
-    if readfitsimage:
-        print('reading fits')
-        hdulist = fits.open(inputfile)
-        w = wcs.WCS(hdulist[0].header)    # assuming WCS is in extension 0
-        readfitsimage = False
-        readfitsimage = False
-    '''
-
-    if plot_sources == 'Yes':
-        print('creating region file from source list')
-        # here we read the list ra dec and create a DS9 region file
-        data = ascii.read(sourcelist)
-        # this gives the number of columns in the input file
-        # print(len(data.colnames))
-
-        if len(data.colnames) == 2:
-            flagsources = 2
-            # in this case the user inputs ra dec
-            ra = np.array(data['col1'], np.float_)
-            dec = np.array(data['col2'], np.float_)
-            # print(ra)
-            # print(dec)
-            world = []
-            for i in range(len(ra)):
-                world.append((ra[i], dec[i]))
-            pixcrd2 = w.wcs_world2pix(world, 1)
-            xx = []
-            yy = []
-            for i in range(len(ra)):
-                xx.append(pixcrd2[[i], 0])
-                yy.append(pixcrd2[[i], 1])
-            xwcs = np.array(xx, np.float_)
-            ywcs = np.array(yy, np.float_)
-            x = [float(i) for i in xwcs]
-            y = [float(i) for i in ywcs]
-
-            outputfile = os.path.join(outdir, 'ds9-sources.reg')
-            file = open(outputfile, "w")
-            file.write(
-                'global color=yellow width=1 font="helvetica 15 normal roman"   select=0 highlite=1 \n')
-            file.write('image\n')
-            #pos = 0
-            for i in range(len(ra)):
-                c2 = "%10s" % str(x[i])
-                c3 = "%10s" % str(y[i])
-                newline = 'circle(' + c2 + ',' + c3 + ',5) # text={}' + '\n'
-                file.write(newline)
-            file.close()
-
-        if len(data.colnames) >= 3:
-            flagsources = 3
-            # in this case the user inputs ra dec source-type
-            ra = np.array(data['col1'], np.float_)
-            dec = np.array(data['col2'], np.float_)
-            sourcetype = data['col3']
-            # print(ra)
-            # print(dec)
-            # print(sourcetype.info)
-            # select sources according to type
-            a = np.where(sourcetype == 'F')[0]  # fillers
-            rafill = ra[a]
-            decfill = dec[a]
-            a = np.where(sourcetype == 'P')[0]  # primary sources
-            rap = ra[a]
-            decp = dec[a]
-
-            # region file of fillers
-            world = []
-            for i in range(len(rafill)):
-                world.append((rafill[i], decfill[i]))
-            pixcrd2 = w.wcs_world2pix(world, 1)
-            xx = []
-            yy = []
-            for i in range(len(rafill)):
-                xx.append(pixcrd2[[i], 0])
-                yy.append(pixcrd2[[i], 1])
-            xwcs = np.array(xx, np.float_)
-            ywcs = np.array(yy, np.float_)
-            x = [float(i) for i in xwcs]
-            y = [float(i) for i in ywcs]
-
-            outputfile = os.path.join(outdir, 'ds9-sources-fillers.reg')
-            file = open(outputfile, "w")
-            file.write(
-                'global color=yellow width=1 font="helvetica 15 normal roman"   select=0 highlite=1 \n')
-            file.write('image\n')
-            #pos = 0
-            for i in range(len(rafill)):
-                c2 = "%10s" % str(x[i])
-                c3 = "%10s" % str(y[i])
-                newline = 'circle(' + c2 + ',' + c3 + ',5) # text={}' + '\n'
-                file.write(newline)
-            file.close()
-
-            # region file of primary sources
-            world = []
-            for i in range(len(rap)):
-                world.append((rap[i], decp[i]))
-            pixcrd2 = w.wcs_world2pix(world, 1)
-            xx = []
-            yy = []
-            for i in range(len(rap)):
-                xx.append(pixcrd2[[i], 0])
-                yy.append(pixcrd2[[i], 1])
-            xwcs = np.array(xx, np.float_)
-            ywcs = np.array(yy, np.float_)
-            x = [float(i) for i in xwcs]
-            y = [float(i) for i in ywcs]
-
-            outputfile = os.path.join(outdir, 'ds9-sources-primary.reg')
-            file = open(outputfile, "w")
-            file.write(
-                'global color=red width=1 font="helvetica 15 normal roman"  select=0  highlite=1 \n')
-            file.write('image\n')
-            #pos = 0
-            for i in range(len(rap)):
-                c2 = "%10s" % str(x[i])
-                c3 = "%10s" % str(y[i])
-                newline = 'circle(' + c2 + ',' + c3 + ',5) # text={}' + '\n'
-                file.write(newline)
-            file.close()
-        if len(data.colnames) < 2:
-            print('Invalid input file')
-#-------------------------------------------------------------------
-    # nirspec msa
     if plot_msa == 'Yes':
         print('processing NIRSPEC MSA')
-        v2msa, v3msa, aper, v2ref, v3ref = read_table(
-            os.path.join(PKG_DATA_DIR, 'table-nirspec-msa.txt'))
-        v2msa = np.array(v2msa, np.float_)
-        v3msa = np.array(v3msa, np.float_)
-
-#---------------------------
-#  here i need to transform ra dec to float        06JUN2017  LEONARDO
-
         print('using NIRSpec RA  :', ra_msa)
         print('using NIRSpec DEC :', dec_msa)
-
-        if (' ' in ra_msa) and (' ' in dec_msa):
-            # it recognizes that the string has the format   hh mm ss.sss
-            b = ra_msa + ' ' + dec_msa
-            c = SkyCoord(b, unit=(u.hourangle, u.deg))
-            #   transform to degrees to be used in the rest of the code
-            ra = c.ra.deg
-            dec = c.dec.deg
-            ra_msa = np.array(ra, np.float_)
-            dec_msa = np.array(dec, np.float_)
-
-        else:  # string is in units of degrees
-            ra_msa = np.array(ra_msa, np.float_)
-            dec_msa = np.array(dec_msa, np.float_)
-#----------------------------------------------------------------------------
-
-        x2 = v2msa
-        x3 = v3msa
-        # search point in the center of each aperture
-        xmsa1 = (x2[0] + x2[2]) / 2.0
-        ymsa1 = (x3[0] + x3[2]) / 2.0
-        xmsa2 = (x2[5] + x2[7]) / 2.0
-        ymsa2 = (x3[5] + x3[7]) / 2.0
-        xmsa3 = (x2[10] + x2[12]) / 2.0
-        ymsa3 = (x3[10] + x3[12]) / 2.0
-        xmsa4 = (x2[15] + x2[17]) / 2.0
-        ymsa4 = (x3[15] + x3[17]) / 2.0
-
-        # calculate center for rotation
-        xr13 = (xmsa1 + xmsa3) / 2.0
-        yr13 = (ymsa1 + ymsa3) / 2.0
-        xr24 = (xmsa2 + xmsa4) / 2.0
-        yr24 = (ymsa2 + ymsa4) / 2.0
-        xr = (xr13 + xr24) / 2.
-        yr = (yr13 + yr24) / 2.
-
-        v2 = v2msa
-        v3 = v3msa
-        xr0 = xr
-        yr0 = yr
-        ra0 = ra_msa
-        dec0 = dec_msa
-        pa = theta_msa
-        myv2 = []
-        myv3 = []
-        v20 = xr0
-        v30 = yr0
-        m = attitude(v20, v30, ra0, dec0, pa)
-        for k in range(len(v2)):
-            a = pointing(m, v2[k], v3[k])
-            myv2 = np.append(myv2, a[0])
-            myv3 = np.append(myv3, a[1])
-        myv2 = np.array(myv2)
-        myv3 = np.array(myv3)
-        # create_footprint(input,myv2,myv3,5,'ds9-msa.reg','red') # 5 because
-        # is includes the IFU aperture
-        # 5 because it includes the IFU aperture
-        create_footprint(
-            input,
-            myv2,
-            myv3,
-            5,
-            os.path.join(outdir, 'ds9-msa.reg'),
-            colmsa)
-        create_footprint_center(
-            input,
-            ra_msa,
-            dec_msa,
-            os.path.join(outdir, 'ds9-msa-centre.reg'),
-            colmsa)
-
-    #-------------------------------------------------------------------
-    # nircam long
-    # print plot_long
     if plot_long == 'Yes':
         print('processing NIRCAM LWC')
-
-
-#--------------------------------------------------------------------------
-#  here i need to transform ra dec to float             06JUN2017  LEONARDO
-
-        print('using NIRCAm RA  :', ra_long)
-        print('using NIRCam DEC :', dec_long)
-
-        if (' ' in ra_long) and (' ' in dec_long):
-            # it recognizes that the string has the format   hh mm ss.sss
-            b = ra_long + ' ' + dec_long
-            c = SkyCoord(b, unit=(u.hourangle, u.deg))
-            #   transform to degrees to be used in the rest of the code
-            ra = c.ra.deg
-            dec = c.dec.deg
-            ra_long = np.array(ra, np.float_)
-            dec_long = np.array(dec, np.float_)
-
-        else:  # string is in units of degrees
-            ra_long = np.array(ra_long, np.float_)
-            dec_long = np.array(dec_long, np.float_)
-#----------------------------------------------------------------------------
-        create_footprint_center(
-            inputfile,
-            ra_long,
-            dec_long,
-            os.path.join(outdir, 'ds9-long-centre.reg'),
-            collong)
-        v2c, v3c, aper, v2ref, v3ref = read_table(
-            os.path.join(PKG_DATA_DIR, 'table-nircam-long.txt'))
-        v2_0 = np.array(v2c, np.float_)
-        v3_0 = np.array(v3c, np.float_)
-
-        if dither_pattern_long == 'None' and mosaic == 'No':
-            #shiftv2 = [0.0, -58.0,  58.0]
-            #shiftv3 = [0.0, -23.5,  23.5]
-            v2 = v2_0
-            v3 = v3_0
-            # determine center of rotation
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long
-            myv2 = []
-            myv3 = []
-            # for shft in (0,1,2):
-            v20 = xr0
-            v30 = yr0
-            m = attitude(v20, v30, ra0, dec0, pa)
-            for k in range(len(v2)):
-                a = pointing(m, v2[k], v3[k])
-                myv2 = np.append(myv2, a[0])
-                myv3 = np.append(myv3, a[1])
-            myv2 = np.array(myv2)
-            myv3 = np.array(myv3)
-            create_footprint(inputfile,
-                             myv2,
-                             myv3,
-                             2,
-                             os.path.join(outdir, 'ds9-long-no.reg'),
-                             collong)
-
-        if dither_pattern_long == 'FULL3' and mosaic == 'No':
-            shiftv2 = [0.0, -58.0, 58.0]
-            shiftv3 = [0.0, -23.5, 23.5]
-            v2 = v2_0
-            v3 = v3_0
-            # determine center of rotation
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2):
-                v20 = xr0 + (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                6,
-                os.path.join(outdir, 'ds9-long-three.reg'),
-                collong)
-
-        if dither_pattern_long == 'FULL3TIGHT' and mosaic == 'No':
-            shiftv2 = [0.0, -58.0, 58.0]
-            shiftv3 = [0.0, -7.5, 7.5]
-            v2 = v2_0
-            v3 = v3_0
-            # determine center of rotation
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2):
-                v20 = xr0 + (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                6,
-                os.path.join(outdir, 'ds9-long-threetight.reg'),
-                collong)
-
-        if dither_pattern_long == 'FULL6' and mosaic == 'No':
-            shiftv2 = [-72.0, -43.0, -14.0, 15.0, 44.0, 73.0]
-            shiftv3 = [-30.0, -18.0, -6.0, 6.0, 18.0, 30.0]
-            # determine center of rotation
-            v2 = v2_0 + 73.0
-            v3 = v3_0 + 30.0
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            v2 = v2_0 - 72.0
-            v3 = v3_0 - 30.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-
-            v2 = v2_0
-            v3 = v3_0
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2, 3, 4, 5):
-                v20 = xr0 + (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                12,
-                os.path.join(outdir, 'ds9-long-six.reg'),
-                collong)
-
-        if (dither_pattern_long == 'FULL3' or dither_pattern_long ==
-                'FULL3TIGHT' or dither_pattern_long == 'None') and mosaic == 'Yes':
-            if dither_pattern_long == 'FULL3':
-                shiftv3 = [0.0, -23.5, 23.5, usershiftv3 + 0.0,
-                           usershiftv3 - 23.5, usershiftv3 + 23.5]
-            if dither_pattern_long == 'FULL3TIGHT':
-                shiftv3 = [0.0, -7.5, 7.5, usershiftv3 + 0.0,
-                           usershiftv3 - 7.5, usershiftv3 + 7.5]
-
-            shiftv2 = [0.0, -58.0, 58.0, usershiftv2 + 0.0,
-                       usershiftv2 - 58.0, usershiftv2 + 58.0]
-            if (dither_pattern_long == 'None'):
-                shiftv3 = [0.0, usershiftv3 + 0.0]
-                shiftv2 = [0.0, usershiftv2 + 0.0]
-
-            v2 = v2_0
-            v3 = v3_0
-            # determine center of rotation
-            v2 = np.append(v2, v2 + usershiftv2)
-            v3 = np.append(v3, v3 + usershiftv3)
-            ascii.write([v2, v3], 'values.dat')
-
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr1 = ((xa + xb) / 2.)
-            yr1 = ((ya + yb) / 2.)
-            xa = (v2[10] + v2[12]) / 2.0
-            ya = (v3[10] + v3[12]) / 2.0
-            xb = (v2[15] + v2[17]) / 2.0
-            yb = (v3[15] + v3[17]) / 2.0
-            xr2 = ((xa + xb) / 2.)
-            yr2 = ((ya + yb) / 2.)
-
-            xr = ((xr1 + xr2) / 2.)
-            yr = ((yr1 + yr2) / 2.)
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long
-            myv2 = []
-            myv3 = []
-            for shft in range(len(shiftv2)):
-                v20 = xr0 + (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                #print(v20, v30)
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            if (dither_pattern_long == 'None'):
-                napertures = 4
-            if (dither_pattern_long ==
-                    'FULL3' or dither_pattern_long == 'FULL3TIGHT'):
-                napertures = 12
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                napertures,
-                os.path.join(outdir, 'ds9-long-mosaic.reg'),
-                collong)
-
-
-#-------------------------------------------------------------------
-# nircam short
     if plot_short == 'Yes':
         print('processing NIRCAM SWC')
-
-        v2sh, v3sh, aper, v2ref, v3ref = read_table(
-            os.path.join(PKG_DATA_DIR, 'table-nircam-short.txt'))
-        v2sh = np.array(v2sh, np.float_)
-        v3sh = np.array(v3sh, np.float_)
-
-#--------------------------------------------------------------------------
-#  here i need to transform ra dec to float          06JUN2017    LEONARDO
-
+    if nircam:
         print('using NIRCAm RA  :', ra_long)
         print('using NIRCam DEC :', dec_long)
-        ra_short = ra_long
-        dec_short = dec_long
-
-        if (' ' in ra_long) and (' ' in dec_long):
-            # it recognizes that the string has the format   hh mm ss.sss
-            b = ra_long + ' ' + dec_long
-            c = SkyCoord(b, unit=(u.hourangle, u.deg))
-            #   transform to degrees to be used in the rest of the code
-            ra = c.ra.deg
-            dec = c.dec.deg
-            ra_short = np.array(ra, np.float_)
-            dec_short = np.array(dec, np.float_)
-
-        else:  # string is in units of degrees
-            ra_short = np.array(ra_short, np.float_)
-            dec_short = np.array(dec_short, np.float_)
-#----------------------------------------------------------------------------
-
-        create_footprint_center(
-            inputfile,
-            ra_short,
-            dec_short,
-            os.path.join(outdir, 'ds9-short-centre.reg'),
-            colshort)
-
-        if dither_pattern_short == 'None':
-            x2 = v2sh
-            x3 = v3sh
-            v2 = v2sh
-            v3 = v3sh
-            # determine center of rotation
-            # search point in the center of each aperture
-            xsh1 = (x2[0] + x2[2]) / 2.0
-            ysh1 = (x3[0] + x3[2]) / 2.0
-            xsh2 = (x2[5] + x2[7]) / 2.0
-            ysh2 = (x3[5] + x3[7]) / 2.0
-            xsh3 = (x2[20] + x2[22]) / 2.0
-            ysh3 = (x3[20] + x3[22]) / 2.0
-            xsh4 = (x2[25] + x2[27]) / 2.0
-            ysh4 = (x3[25] + x3[27]) / 2.0
-
-            # calculate center for rotation
-            xr13 = (xsh1 + xsh3) / 2.0
-            yr13 = (ysh1 + ysh3) / 2.0
-            xr24 = (xsh2 + xsh4) / 2.0
-            yr24 = (ysh2 + ysh4) / 2.0
-            xr = (xr13 + xr24) / 2.
-            yr = (yr13 + yr24) / 2.
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short
-            myv2 = []
-            myv3 = []
-            v20 = xr0
-            v30 = yr0
-            m = attitude(v20, v30, ra0, dec0, pa)
-            for k in range(len(v2)):
-                a = pointing(m, v2[k], v3[k])
-                myv2 = np.append(myv2, a[0])
-                myv3 = np.append(myv3, a[1])
-            myv2 = np.array(myv2)
-            myv3 = np.array(myv3)
-            # print(myv2)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                8,
-                os.path.join(outdir, 'ds9-short-no.reg'),
-                colshort)
-
-        if dither_pattern_short == 'FULL3':
-            shiftv2 = [0.0, -58.0, 58.0]
-            shiftv3 = [0.0, -23.5, 23.5]
-            x2 = v2sh
-            x3 = v3sh
-            v2 = v2sh
-            v3 = v3sh
-            # determine center of rotation
-            # search point in the center of each aperture
-            xsh1 = (x2[0] + x2[2]) / 2.0
-            ysh1 = (x3[0] + x3[2]) / 2.0
-            xsh2 = (x2[5] + x2[7]) / 2.0
-            ysh2 = (x3[5] + x3[7]) / 2.0
-            xsh3 = (x2[20] + x2[22]) / 2.0
-            ysh3 = (x3[20] + x3[22]) / 2.0
-            xsh4 = (x2[25] + x2[27]) / 2.0
-            ysh4 = (x3[25] + x3[27]) / 2.0
-            # calculate center for rotation
-            xr13 = (xsh1 + xsh3) / 2.0
-            yr13 = (ysh1 + ysh3) / 2.0
-            xr24 = (xsh2 + xsh4) / 2.0
-            yr24 = (ysh2 + ysh4) / 2.0
-            xr = (xr13 + xr24) / 2.
-            yr = (yr13 + yr24) / 2.
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2):
-                v20 = xr0 + (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                24,
-                os.path.join(outdir, 'ds9-short-three.reg'),
-                colshort)
-
-        if dither_pattern_short == 'FULL3TIGHT':
-            shiftv2 = [0.0, -58.0, 58.0]
-            shiftv3 = [0.0, -7.5, 7.5]
-            x2 = v2sh
-            x3 = v3sh
-            v2 = v2sh
-            v3 = v3sh
-            # determine center of rotation
-            # search point in the center of each aperture
-            xsh1 = (x2[0] + x2[2]) / 2.0
-            ysh1 = (x3[0] + x3[2]) / 2.0
-            xsh2 = (x2[5] + x2[7]) / 2.0
-            ysh2 = (x3[5] + x3[7]) / 2.0
-            xsh3 = (x2[20] + x2[22]) / 2.0
-            ysh3 = (x3[20] + x3[22]) / 2.0
-            xsh4 = (x2[25] + x2[27]) / 2.0
-            ysh4 = (x3[25] + x3[27]) / 2.0
-
-            # calculate center for rotation
-            xr13 = (xsh1 + xsh3) / 2.0
-            yr13 = (ysh1 + ysh3) / 2.0
-            xr24 = (xsh2 + xsh4) / 2.0
-            yr24 = (ysh2 + ysh4) / 2.0
-            xr = (xr13 + xr24) / 2.
-            yr = (yr13 + yr24) / 2.
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2):
-                v20 = xr0 + (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                24,
-                os.path.join(outdir, 'ds9-short-threetight.reg'),
-                colshort)
-
-        if dither_pattern_short == 'FULL6':
-            shiftv2 = [-72.0, -43.0, -14.0, 15.0, 44.0, 73.0]
-            shiftv3 = [-30.0, -18.0, -6.0, 6.0, 18.0, 30.0]
-
-            # determine center of rotation using info from long dither pattern
-            v2sh, v3sh, aper, v2ref, v3ref = read_table(
-                os.path.join(PKG_DATA_DIR, 'table-nircam-long.txt'))
-            v2sh = np.array(v2sh, np.float_)
-            v3sh = np.array(v3sh, np.float_)
-
-            v2 = v2sh + 73.0
-            v3 = v3sh + 30.0
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            v2 = v2sh - 72.0
-            v3 = v3sh - 30.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-
-            v2sh, v3sh, aper, v2ref, v3ref = read_table(
-                os.path.join(PKG_DATA_DIR, 'table-nircam-short.txt'))
-            v2sh = np.array(v2sh, np.float_)
-            v3sh = np.array(v3sh, np.float_)
-
-            v2 = v2sh
-            v3 = v3sh
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2, 3, 4, 5):
-                v20 = xr0 + (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                48,
-                os.path.join(outdir, 'ds9-short-six.reg'),
-                colshort)
-
-
-#  mosaic  short wavelength channel
-
-        if (dither_pattern_short == 'FULL3' or dither_pattern_short ==
-                'FULL3TIGHT' or dither_pattern_short == 'None') and mosaic == 'Yes':
-            if dither_pattern_short == 'FULL3':
-                shiftv3 = [0.0, -23.5, 23.5, usershiftv3 + 0.0,
-                           usershiftv3 - 23.5, usershiftv3 + 23.5]
-            if dither_pattern_short == 'FULL3TIGHT':
-                shiftv3 = [0.0, -7.5, 7.5, usershiftv3 + 0.0,
-                           usershiftv3 - 7.5, usershiftv3 + 7.5]
-
-            shiftv2 = [0.0, -58.0, 58.0, usershiftv2 + 0.0,
-                       usershiftv2 - 58.0, usershiftv2 + 58.0]
-
-            if (dither_pattern_short == 'None'):
-                shiftv3 = [0.0, usershiftv3 + 0.0]
-                shiftv2 = [0.0, usershiftv2 + 0.0]
-            v2 = v2sh
-            v3 = v3sh
-
-            # determine center of rotation
-            v2 = np.append(v2, v2 + usershiftv2)
-            v3 = np.append(v3, v3 + usershiftv3)
-            ascii.write([v2, v3], 'values.dat')
-
-            xa = (v2[0] + v2[22]) / 2.0
-            ya = (v3[0] + v3[22]) / 2.0
-            xb = (v2[8] + v2[26]) / 2.0
-            yb = (v3[8] + v3[26]) / 2.0
-            xr1 = ((xa + xb) / 2.)
-            yr1 = ((ya + yb) / 2.)
-            xa = (v2[40] + v2[62]) / 2.0
-            ya = (v3[40] + v3[62]) / 2.0
-            xb = (v2[48] + v2[66]) / 2.0
-            yb = (v3[48] + v3[66]) / 2.0
-            xr2 = ((xa + xb) / 2.)
-            yr2 = ((ya + yb) / 2.)
-
-            xr = ((xr1 + xr2) / 2.)
-            yr = ((yr1 + yr2) / 2.)
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short
-            myv2 = []
-            myv3 = []
-            v2 = v2sh
-            v3 = v3sh
-            for shft in range(len(shiftv2)):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 - (shiftv3[shft])  # here we shift
-                #print(v20, v30)
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            if (dither_pattern_short == 'None'):
-                napertures = 16
-            if (dither_pattern_short ==
-                    'FULL3' or dither_pattern_short == 'FULL3TIGHT'):
-                napertures = 48
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                napertures,
-                os.path.join(outdir, 'ds9-short-mosaic.reg'),
-                colshort)
-#  mosaic  short wavelength channel
-
-    # Start xpans prior to running DS9
-    pyds9.ds9_xpans()
-
-    # Run DS9
-    d = pyds9.DS9()
-    d.set('tile yes')
-    d.set('frame 1')
-    d.set('cmap ' + ds9cmap)
-    d.set('scale limits ' + ds9limmin + ' ' + ds9limmax)
-    d.set('scale ' + ds9scale)
-    d.set('file ' + inputfile)
-    # load regions
-    if plot_long == 'Yes':
-        d.set('regions ' + os.path.join(outdir, 'ds9-long-centre.reg'))
-        if mosaic == 'No':
-            if dither_pattern_long == 'FULL3TIGHT':
-                d.set('regions ' + os.path.join(outdir, 'ds9-long-threetight.reg'))
-            if dither_pattern_long == 'FULL3':
-                d.set('regions ' + os.path.join(outdir, 'ds9-long-three.reg'))
-            if dither_pattern_long == 'FULL6':
-                d.set('regions ' + os.path.join(outdir, 'ds9-long-six.reg'))
-            if dither_pattern_long == 'None':
-                d.set('regions ' + os.path.join(outdir, 'ds9-long-no.reg'))
-        if mosaic == 'Yes':
-            d.set('regions ' + os.path.join(outdir, 'ds9-long-mosaic.reg'))
 
-    if plot_short == 'Yes':
-        d.set('regions ' + os.path.join(outdir, 'ds9-short-centre.reg'))
-        if mosaic == 'No':
-            if dither_pattern_short == 'FULL3TIGHT':
-                d.set('regions ' + os.path.join(outdir, 'ds9-short-threetight.reg'))
-            if dither_pattern_short == 'FULL3':
-                d.set('regions ' + os.path.join(outdir, 'ds9-short-three.reg'))
-            if dither_pattern_short == 'FULL6':
-                d.set('regions ' + os.path.join(outdir, 'ds9-short-six.reg'))
-            if dither_pattern_short == 'None':
-                d.set('regions ' + os.path.join(outdir, 'ds9-short-no.reg'))
-        if mosaic == 'Yes':
-            d.set('regions ' + os.path.join(outdir, 'ds9-short-mosaic.reg'))
-
-    if plot_msa == 'Yes':
-        d.set('regions ' + os.path.join(outdir, 'ds9-msa.reg'))
-        d.set('regions ' + os.path.join(outdir, 'ds9-msa-centre.reg'))
+    fp = compute_footprints(plot_long, plot_short, plot_msa,
+                            ra_long, dec_long, theta_long,
+                            dither_pattern_long,
+                            ra_msa, dec_msa, theta_msa,
+                            mosaic, usershiftv2, usershiftv3,
+                            mosaic_shape, mosaic_overlap)
+
+    nircam_name = None
+    if nircam and mosaic == 'Yes':
+        nircam_name = 'mosaic'
+    elif nircam:
+        nircam_name = DITHER_PATTERNS[dither_pattern_long]['suffix']
+    centre_long = parse_radec(ra_long, dec_long)
+
+    if len(fp):
+        # caps around the polygons, to reject the chips they cannot touch
+        centres, radii = polygon_edges(fp)[:2]
+
+    regions = dict(
+        names={'long': nircam_name, 'short': nircam_name, 'msa': None},
+        colors={'long': collong, 'short': colshort, 'msa': colmsa},
+        centres={'long': centre_long,
+                 'short': centre_long,
+                 'msa': parse_radec(ra_msa, dec_msa)})
+    if sky:
+        # one set of region files, in outdir, for all the chips
+        skyregions = footprint_regions(fp, None, outdir,
+                                       system=region_system, write=write,
+                                       **regions)
+
+    if export_formats:
+        export_footprints(fp, outdir, export_formats)
+
+    frames = []
+    images = []
+    chipdirs = []
+    for image in chips:
+        if len(chips) == 1:
+            # a single image keeps the region files in outdir
+            chipdir = outdir
+            selected = fp
+            chipfile = inputfile
+            if image.ext != 0:
+                # e.g. the SCI extension behind an empty primary header
+                chipfile = '{}[{}]'.format(inputfile, image.ext)
+        else:
+            chipdir = os.path.join(outdir, image.name)
+            selected = fp
+            if len(fp):
+                selected = fp[image.overlaps(centres, radii)]
+                if len(selected) == 0:
+                    continue
+            chipfile = '{}[{}]'.format(inputfile, image.ext)
+            print('projecting on chip ' + image.name)
+
+        if sky:
+            chipregions = list(skyregions)
+        else:
+            chipregions = footprint_regions(selected, image, chipdir,
+                                            write=write, **regions)
+
+        if coverage_map == 'Yes':
+            print('creating coverage depth map')
+            if not os.path.exists(chipdir):
+                os.makedirs(chipdir, mode=0o0755)
+            depth_maps(selected, image, chipdir,
+                       processes=coverage_processes)
+
+        frames.append((chipfile, chipregions))
+        images.append(image)
+        chipdirs.append(chipdir)
 
     if plot_sources == 'Yes':
-        if flagsources == 3:
-            # print(plot_sources)
-            d.set('regions ' + os.path.join(outdir, 'ds9-sources-fillers.reg'))
-            d.set('regions ' + os.path.join(outdir, 'ds9-sources-primary.reg'))
-        if flagsources == 2:
-            # print(plot_sources)
-            d.set('regions ' + os.path.join(outdir, 'ds9-sources.reg'))
+        # here we read the list ra dec and create the DS9 region files
+        catalog = open_catalog(sourcelist, catalog_columns,
+                               cache_budget=cache_budget)
+        # the text is kept only to be displayed
+        if sky:
+            sourceregions = source_regions(catalog, [None], [outdir],
+                                           source_styles, region_system,
+                                           write, bool(frames))[0]
+            for chipfile, chipregions in frames:
+                chipregions += sourceregions
+        else:
+            for (chipfile, chipregions), sourceregions in zip(
+                    frames, source_regions(catalog, images, chipdirs,
+                                           source_styles, write=write)):
+                chipregions += sourceregions
+        if source_coverage == 'Yes' and catalog.ncolumns >= 2:
+            # which sources fall in which apertures
+            if not os.path.exists(outdir):
+                os.makedirs(outdir, mode=0o0755)
+            catalog_membership(fp, catalog,
+                               os.path.join(outdir, 'sources-coverage.txt'))
+
+    if frames and display_backend == 'png':
+        render_frames(frames, outdir, ds9cmap, ds9limmin, ds9limmax,
+                      ds9scale, png_size)
+    elif frames:
+        display(frames, ds9cmap, ds9limmin, ds9limmax, ds9scale)
@@ -398,6 +398,21 @@ class FootprintsUI(object):
 
     def makefootprints(self):
         if self.ptVar.get() == 'footprints':
+            cache_budget = self.config['cache_budget']
+            if cache_budget is None:
+                cache_budget = default_config['cache_budget']
+            region_files = self.config['region_files']
+            if region_files is None:
+                region_files = default_config['region_files']
+            display_backend = self.config['display_backend']
+            if display_backend is None:
+                display_backend = default_config['display_backend']
+            png_size = self.config['png_size']
+            if png_size is None:
+                png_size = default_config['png_size']
+            source_coverage = self.config['source_coverage']
+            if source_coverage is None:
+                source_coverage = default_config['source_coverage']
             # print(self.catVar.get())
             footprints(self.fileVar.get(),
                        self.catVar.get(),
@@ -422,7 +437,13 @@ class FootprintsUI(object):
                        self.ds9limminVar.get(),
                        self.ds9limmaxVar.get(),
                        self.ds9scaleVar.get(),
-                       self.outdirVar.get())
+                       self.outdirVar.get(),
+                       source_styles=self.config['source_styles'],
+                       cache_budget=int(cache_budget) << 20,
+                       region_files=region_files,
+                       display_backend=display_backend,
+                       png_size=int(png_size),
+                       source_coverage=source_coverage)
             # self.readfitsimageVar.get())
 
     def readcataloguename(self):
@@ -431,6 +452,10 @@ class FootprintsUI(object):
         filename = askopenfilename(initialdir=os.path.abspath(os.curdir),
                                    title='Select RADEC file',
                                    filetypes=(('RADEC files', '*.radec'),
+                                              ('FITS tables', '*.fits *.fit'),
+                                              ('NumPy files', '*.npy *.npz'),
+                                              ('Parquet files',
+                                               '*.parquet *.pq'),
                                               ('all files', '*.*')))
 
         # print(filename)
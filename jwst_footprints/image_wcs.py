@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from __future__ import absolute_import, division, print_function
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from astropy import wcs
+from astropy.io import fits
+
+# positions projected at a time by the TAN fast path
+TAN_BLOCK = 1 << 15
+DEGREES = 180.0 / np.pi
+
+# ImageWCS of the most recently used files, keyed by path, extension,
+# modification time and size, and their lists of image extensions, keyed
+# by path, modification time and size
+CACHE_SIZE = 16
+_cache = OrderedDict()
+_chips_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def read_header(inputfile, ext=0):
+    '''Header of extension ext of a FITS file, without reading any data: the
+    file is memory mapped and only the headers up to ext are parsed'''
+    with fits.open(inputfile, memmap=True, lazy_load_hdus=True) as hdulist:
+        return hdulist[ext].header.copy()
+
+
+def image_extensions(inputfile):
+    '''Indices of the 2-dimensional image HDUs of a FITS file with a
+    celestial WCS, read from the headers only. When there are SCI
+    extensions only they are kept: the WHT, CON, ERR... extensions of a
+    pipeline product share the WCS of their SCI image'''
+    extensions = []
+    science = []
+    with fits.open(inputfile, memmap=True, lazy_load_hdus=True) as hdulist:
+        for ext, hdu in enumerate(hdulist):
+            if not hdu.is_image or hdu.header.get('NAXIS', 0) != 2:
+                continue
+            if wcs.WCS(hdu.header).has_celestial:
+                extensions.append(ext)
+                if hdu.header.get('EXTNAME', '').strip().upper() == 'SCI':
+                    science.append(ext)
+    return science or extensions
+
+
+def _cache_get(cache, key):
+    # the value of key, moved to the most recently used end, or None
+    with _cache_lock:
+        value = cache.pop(key, None)
+        if value is not None:
+            cache[key] = value
+        return value
+
+
+def _cache_put(cache, key, value):
+    # stores value, dropping the least recently used entries beyond
+    # CACHE_SIZE
+    with _cache_lock:
+        cache[key] = value
+        while len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def image_chips(inputfile):
+    '''ImageWCS of every image HDU with a celestial WCS of a FITS file, e.g.
+    the SCI extensions of the detector chips of a pipeline product'''
+    path = os.path.abspath(inputfile)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    extensions = _cache_get(_chips_cache, key)
+    if extensions is None:
+        extensions = image_extensions(path)
+        _cache_put(_chips_cache, key, extensions)
+    return [ImageWCS.from_file(path, ext) for ext in extensions]
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        _chips_cache.clear()
+
+
+class ImageWCS(object):
+    """
+    World coordinate system of the image the regions are drawn on.
+
+    It is handed explicitly to the region writers, so several images can be
+    processed at the same time, e.g. from a thread pool.
+    """
+
+    def __init__(self, header, ext=0):
+        self.header = header
+        self.ext = ext
+        self.wcs = wcs.WCS(header)
+        # wcslib initialises its internal state lazily on the first
+        # transformation; do it now and serialise the calls of this instance
+        self.wcs.wcs.set()
+        self._lock = threading.Lock()
+        self._cap = None
+        self._tan = self._tan_parameters()
+
+    def _tan_parameters(self):
+        # a plain gnomonic projection without any distortion is done
+        # directly with numpy, anything else goes through wcslib
+        w = self.wcs
+        if list(w.wcs.ctype) != ['RA---TAN', 'DEC--TAN']:
+            return None
+        # wcslib turns TPV into TAN with a distortion astropy does not show:
+        # look at the header itself
+        header = self.header
+        if [header.get('CTYPE1'), header.get('CTYPE2')] != ['RA---TAN',
+                                                            'DEC--TAN']:
+            return None
+        if any(k.startswith(('PV1_', 'PV2_', 'DP1', 'DP2', 'DQ1', 'DQ2'))
+               for k in header):
+            return None
+        if (w.sip is not None or w.cpdis1 is not None or
+                w.cpdis2 is not None or w.det2im1 is not None or
+                w.det2im2 is not None or len(w.wcs.get_pv()) > 0):
+            return None
+        if w.wcs.lonpole != 180.0 or list(w.wcs.cunit) != ['deg', 'deg']:
+            return None
+        ra0, dec0 = np.radians(w.wcs.crval)
+        return (ra0, np.sin(dec0), np.cos(dec0), w.wcs.crpix.copy(),
+                np.linalg.inv(w.pixel_scale_matrix))
+
+    @property
+    def name(self):
+        '''Name of the chip: EXTNAME and EXTVER, or the extension index'''
+        if 'EXTNAME' in self.header:
+            return '{}{}'.format(self.header['EXTNAME'],
+                                 self.header.get('EXTVER', ''))
+        return 'ext{}'.format(self.ext)
+
+    @property
+    def shape(self):
+        return (self.header['NAXIS2'], self.header['NAXIS1'])
+
+    @classmethod
+    def from_file(cls, inputfile, ext=0):
+        '''ImageWCS of extension ext of a FITS file. It is cached, so that
+        the header is parsed again only when the file changes'''
+        path = os.path.abspath(inputfile)
+        stat = os.stat(path)
+        key = (path, ext, stat.st_mtime, stat.st_size)
+        image = _cache_get(_cache, key)
+        if image is None:
+            image = cls(read_header(path, ext), ext)
+            _cache_put(_cache, key, image)
+        return image
+
+    def world2pix(self, ra, dec):
+        """Pixel coordinates (1-based, as used by DS9) of arrays of ra, dec
+        in degrees"""
+        ra = np.asarray(ra, np.float64)
+        dec = np.asarray(dec, np.float64)
+        if self._tan is not None:
+            return self._tan_world2pix(ra, dec)
+        with self._lock:
+            x, y = self.wcs.wcs_world2pix(ra, dec, 1)
+        return (x, y)
+
+    def _tan_world2pix(self, ra, dec):
+        ra0, sindec0, cosdec0, crpix, cdinv = self._tan
+        shape = np.broadcast(ra, dec).shape
+        ra, dec = [np.ravel(a) for a in np.broadcast_arrays(ra, dec)]
+        x = np.empty(len(ra))
+        y = np.empty(len(ra))
+        # in blocks that stay in the CPU cache
+        for i in range(0, len(ra), TAN_BLOCK):
+            dra = np.radians(ra[i:i + TAN_BLOCK])
+            dra -= ra0
+            d = np.radians(dec[i:i + TAN_BLOCK])
+            cosdec = np.cos(d)
+            sindec = np.sin(d, out=d)
+            cosdra = np.cos(dra)
+            sindra = np.sin(dra, out=dra)
+            # cosine of the distance to the reference point
+            cosc = cosdec * cosdra
+            cosc *= cosdec0
+            cosc += sindec * sindec0
+            # positions on the far hemisphere have no projection
+            cosc[cosc <= 0.0] = np.nan
+            np.divide(DEGREES, cosc, out=cosc)
+            # intermediate world coordinates in degrees
+            xi = sindra
+            xi *= cosdec
+            xi *= cosc
+            eta = cosdec
+            eta *= cosdra
+            eta *= -sindec0
+            sindec *= cosdec0
+            eta += sindec
+            eta *= cosc
+            xb = x[i:i + TAN_BLOCK]
+            yb = y[i:i + TAN_BLOCK]
+            np.multiply(xi, cdinv[0, 0], out=xb)
+            xb += crpix[0]
+            xb += cdinv[0, 1] * eta
+            np.multiply(xi, cdinv[1, 0], out=yb)
+            yb += crpix[1]
+            yb += cdinv[1, 1] * eta
+        return (x.reshape(shape), y.reshape(shape))
+
+    def pix2world(self, x, y):
+        """ra, dec in degrees of arrays of 1-based pixel coordinates"""
+        x = np.asarray(x, np.float64)
+        y = np.asarray(y, np.float64)
+        with self._lock:
+            ra, dec = self.wcs.wcs_pix2world(x, y, 1)
+        return (ra, dec)
+
+    def sky_cap(self):
+        """Centre (unit vector) and chord radius of a cap on the sky that
+        contains the whole image"""
+        if self._cap is None:
+            ny, nx = self.shape
+            # the corners, the middle of the sides and the centre
+            x = np.array([0.5, nx / 2.0 + 0.5, nx + 0.5])
+            y = np.array([0.5, ny / 2.0 + 0.5, ny + 0.5])
+            x, y = np.meshgrid(x, y)
+            ra, dec = np.radians(self.pix2world(x.ravel(), y.ravel()))
+            v = np.array([np.cos(ra) * np.cos(dec),
+                          np.sin(ra) * np.cos(dec),
+                          np.sin(dec)]).T
+            centre = v[4]
+            # padded for the curvature of the sides between the points
+            radius = 1.05 * np.sqrt(((v - centre) ** 2).sum(axis=1)).max()
+            self._cap = (centre, radius)
+        return self._cap
+
+    def overlaps(self, centres, radii=0.0):
+        """Mask of the caps with centres (unit vectors, shape (N, 3)) and
+        chord radii that can touch the image; it needs no world2pix call"""
+        centre, radius = self.sky_cap()
+        distance = np.sqrt(((np.asarray(centres) - centre) ** 2).sum(axis=1))
+        return distance <= radius + radii
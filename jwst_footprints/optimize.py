@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Choice of the position angle and small pointing offset that put the most
+catalog sources (e.g. the primaries, type P) in the apertures.
+
+The apertures are laid out once in the gnomonic plane tangent at the rotation
+reference point of each instrument, where their edges are straight lines and
+a small pointing offset in V2, V3 is a translation. For every position angle
+the sources are rotated into that plane and tested against the edges for all
+the offsets at once; only the sources within an offset of an edge need the
+per-offset test, the others are inside or outside for every offset.
+"""
+from __future__ import absolute_import, division, print_function
+
+import multiprocessing
+
+import numpy as np
+
+from .footprints import NVERTICES, attitudes, dither_footprints, unit
+from .find_tgt_info import allowed_v3pa
+
+# one record per configuration, best first
+OPTIMUM_DTYPE = [('pa', 'f8'),
+                 ('dv2', 'f8'),
+                 ('dv3', 'f8'),
+                 ('sources', 'i8'),
+                 ('hits', 'i8')]
+
+ARCSEC = np.pi / (180.0 * 3600.0)
+
+
+def offset_grid(extent, step):
+    '''Offsets (arcsec) of a square grid in V2, V3 from -extent to +extent
+    in steps of step; returns an array of shape (K, 2)'''
+    steps = np.arange(-extent, extent + step / 2.0, step)
+    dv3, dv2 = np.meshgrid(steps, steps, indexing='ij')
+    return np.column_stack([dv2.ravel(), dv3.ravel()])
+
+
+def aperture_edges(instrument, dither='None'):
+    '''Edges of the apertures of an instrument at every position of a dither
+    pattern, in the plane tangent at its rotation reference point (radians,
+    axes along V2 and V3). Returns the inward unit normals n (P, E, 2), the
+    constants d (P, E) of the edge lines n.p + d = 0 and the bounding box
+    (xmin, xmax, ymin, ymax) of all the apertures'''
+    ra, dec = dither_footprints(instrument, 0.0, 0.0, 0.0, [dither])[dither]
+    x, y, z = unit(ra.reshape(-1, NVERTICES), dec.reshape(-1, NVERTICES))
+    px = y / x
+    py = z / x
+
+    # the last vertex closes every polygon
+    ex = px[:, 1:] - px[:, :-1]
+    ey = py[:, 1:] - py[:, :-1]
+    length = np.sqrt(ex ** 2 + ey ** 2)
+    normals = np.stack([-ey / length, ex / length], axis=-1)
+    d = -(normals[..., 0] * px[:, :-1] + normals[..., 1] * py[:, :-1])
+
+    # the polygons come in either orientation; point the normals inwards
+    cx = px[:, :-1].mean(axis=1)[:, np.newaxis]
+    cy = py[:, :-1].mean(axis=1)[:, np.newaxis]
+    sign = np.sign(normals[..., 0] * cx + normals[..., 1] * cy + d)
+    return (normals * sign[..., np.newaxis], d * sign,
+            (px.min(), px.max(), py.min(), py.max()))
+
+
+def offset_spans(value, normals, rows, columns):
+    '''Offsets that keep sources inside apertures, as spans of offsets.
+    value (M, E) are the distances of M source-aperture pairs to the
+    aperture edges, normals (M, E, 2) the edge normals, rows the distinct
+    dv3 of the offsets and columns, per row, the sorted dv2.
+    Returns, per row, the index range [first, last) into columns[row] of
+    every pair'''
+    spans = []
+    for dv3, dv2 in zip(rows, columns):
+        # moving the apertures by +offset moves every edge by -n.offset, so
+        # each edge bounds dv2 from one side: nx * dv2 <= value - ny * dv3
+        bound = value - normals[..., 1] * dv3
+        nx = normals[..., 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            limit = bound / nx
+        upper = np.where(nx > 0.0, limit, np.inf).min(axis=1)
+        lower = np.where(nx < 0.0, limit, -np.inf).max(axis=1)
+        parallel = ((nx == 0.0) & (bound < 0.0)).any(axis=1)
+        first = np.searchsorted(dv2, lower, 'left')
+        last = np.searchsorted(dv2, upper, 'right')
+        last[parallel] = first[parallel]
+        spans.append((first, np.maximum(first, last)))
+    return spans
+
+
+def coverage_scores(task):
+    '''Number of sources covered and of source-aperture hits for every
+    position angle and offset of task = (vectors, rotations, edges, offsets):
+    source unit vectors (N, 3), the attitude matrices (n_pa, 3, 3) of the
+    pointing, aperture_edges() of every instrument and the offsets (K, 2) in
+    radians. Returns two arrays of shape (n_pa, K)'''
+    vectors, rotations, edges, offsets = task
+    npa = len(rotations)
+    noffsets = len(offsets)
+    radius = np.sqrt((offsets ** 2).sum(axis=1)).max()
+
+    # offsets in rows of equal dv3, each sorted by dv2
+    order = np.lexsort((offsets[:, 0], offsets[:, 1]))
+    dv3, start = np.unique(offsets[order, 1], return_index=True)
+    columns = np.split(offsets[order, 0], start[1:])
+
+    sources = np.zeros((npa, noffsets), np.int64)
+    hits = np.zeros((npa, noffsets), np.int64)
+    for i in range(npa):
+        # sources in the plane tangent at the pointing, where the rotation
+        # reference point of every instrument is placed
+        x, y, z = np.dot(vectors, rotations[i]).T
+        front = x > 0.0
+        px = y[front] / x[front]
+        py = z[front] / x[front]
+        index = np.nonzero(front)[0]
+
+        covered = np.zeros(len(vectors), bool)
+        candidates = []
+        values = []
+        pair_normals = []
+        for normals, d, (xmin, xmax, ymin, ymax) in edges:
+            # only the sources near the apertures can fall in them
+            near = np.nonzero((px >= xmin - radius) & (px <= xmax + radius) &
+                              (py >= ymin - radius) & (py <= ymax + radius))[0]
+
+            # distances to the edges without an offset, (n, P, E)
+            value = (normals[..., 0] * px[near, np.newaxis, np.newaxis] +
+                     normals[..., 1] * py[near, np.newaxis, np.newaxis] + d)
+            nearest = value.min(axis=2)
+            inside = nearest >= radius
+            covered[index[near]] |= inside.any(axis=1)
+            hits[i] += inside.sum()
+
+            # sources within an offset of an edge depend on the offset
+            source, polygon = np.nonzero((nearest > -radius) & ~inside)
+            candidates.append(index[near[source]])
+            values.append(value[source, polygon])
+            pair_normals.append(normals[polygon])
+        sources[i] += covered.sum()
+
+        source = np.concatenate(candidates)
+        if len(source) == 0:
+            continue
+        # number of apertures on every candidate source for every offset,
+        # from +1/-1 steps at the ends of the spans of offsets
+        candidate, source = np.unique(source, return_inverse=True)
+        depth = np.zeros((len(candidate), noffsets + 1), np.int32)
+        spans = offset_spans(np.concatenate(values),
+                             np.concatenate(pair_normals), dv3, columns)
+        for row, (first, last) in zip(start, spans):
+            np.add.at(depth, (source, row + first), 1)
+            np.add.at(depth, (source, row + last), -1)
+        depth = np.cumsum(depth[:, :-1], axis=1)
+
+        hits[i, order] += depth.sum(axis=0)
+        sources[i, order] += (depth[~covered[candidate]] > 0).sum(axis=0)
+
+    return (sources, hits)
+
+
+def allowed_pas(pas, ra, dec, mjd):
+    '''The position angles of pas (degrees) allowed on the date mjd for a
+    pointing at ra, dec (degrees), from the visibility of find_tgt_info'''
+    pas = np.asarray(pas, np.float64)
+    window = allowed_v3pa(ra, dec, mjd)
+    if window is None:
+        return pas[:0]
+    start, end = window
+    return pas[(pas - start) % 360.0 <= (end - start) % 360.0]
+
+
+def optimize_orientation(ra, dec, source_ra, source_dec, pas=None,
+                         offsets=None, instruments=('msa',), dither='None',
+                         mjd=None, nbest=10, processes=None):
+    '''Ranks the position angles pas (degrees, every degree by default) and
+    V2, V3 offsets (arcsec, shape (K, 2), e.g. from offset_grid(), none by
+    default) of a pointing at ra, dec (degrees) by the number of the sources
+    source_ra, source_dec falling in any aperture of the instruments, each
+    placed with its rotation reference point on the pointing as in
+    compute_footprints(). NIRCam uses the dither pattern dither. With mjd
+    only the position angles allowed on that date are scanned. The position
+    angles are split across a pool of processes (all the CPUs by default).
+    Returns the nbest configurations as OPTIMUM_DTYPE records, best first,
+    ties broken by the total number of source-aperture hits'''
+    if pas is None:
+        pas = np.arange(0.0, 360.0, 1.0)
+    pas = np.atleast_1d(np.asarray(pas, np.float64))
+    if mjd is not None:
+        pas = allowed_pas(pas, ra, dec, mjd)
+    if offsets is None:
+        offsets = np.zeros((1, 2))
+    offsets = np.atleast_2d(np.asarray(offsets, np.float64))
+    if len(pas) == 0:
+        return np.zeros(0, dtype=OPTIMUM_DTYPE)
+
+    vectors = np.ascontiguousarray(unit(np.asarray(source_ra, np.float64),
+                                        np.asarray(source_dec,
+                                                   np.float64)).T)
+    edges = [aperture_edges(x, 'None' if x == 'msa' else dither)
+             for x in instruments]
+    # sky to tangent plane: the transposed attitude of the pointing
+    rotations = attitudes(0.0, 0.0, ra, dec, pas)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    chunks = np.array_split(np.arange(len(pas)),
+                            min(len(pas), 4 * processes))
+    tasks = [(vectors, rotations[chunk], edges, offsets * ARCSEC)
+             for chunk in chunks]
+    if processes == 1:
+        results = [coverage_scores(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(coverage_scores, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    sources = np.concatenate([x[0] for x in results])
+    hits = np.concatenate([x[1] for x in results])
+
+    best = np.lexsort((-hits.ravel(), -sources.ravel()))[:nbest]
+    ipa, ioffset = np.unravel_index(best, sources.shape)
+    optimum = np.zeros(len(best), dtype=OPTIMUM_DTYPE)
+    optimum['pa'] = pas[ipa]
+    optimum['dv2'] = offsets[ioffset, 0]
+    optimum['dv3'] = offsets[ioffset, 1]
+    optimum['sources'] = sources.ravel()[best]
+    optimum['hits'] = hits.ravel()[best]
+    return optimum
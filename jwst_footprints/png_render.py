@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Headless rendering of the DS9 frames to PNG files, for hosts without an X
+server or DS9.
+
+The frames are those of display(): an image and the region texts drawn on
+it. The image is read from a memory map one pixel in step along both axes,
+so that only about size x size pixels of a large image are read, and it is
+drawn with the DS9 colormap, limits and scale of the configuration. The
+region texts are read back with parse_regions() and drawn on top: the
+polygons with PIL, the sources as stamps of their shape set with numpy.
+
+PIL is only imported when a frame is rendered.
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+import re
+
+import numpy as np
+from astropy.io import fits
+
+from .image_wcs import ImageWCS
+from .regions import BLOCK, parse_regions
+
+# largest side of the rendered images, in pixels
+PNG_SIZE = 2048
+
+# exponent of the DS9 log and power scales
+SCALE_EXPONENT = 1000.0
+
+# DS9 colormaps: (points of [0, 1], levels at the points) of red, green
+# and blue
+RAMP = ([0, 1], [0, 1])
+DARK = ([0, 1], [0, 0])
+COLORMAPS = {
+    'grey': (RAMP, RAMP, RAMP),
+    'gray': (RAMP, RAMP, RAMP),
+    'red': (RAMP, DARK, DARK),
+    'green': (DARK, RAMP, DARK),
+    'blue': (DARK, DARK, RAMP),
+    'heat': (([0, 0.34, 1], [0, 1, 1]),
+             RAMP,
+             ([0, 0.65, 0.98, 1], [0, 0, 1, 1])),
+}
+
+
+def colormap_table(cmap):
+    '''The 256 RGB colors (256, 3) uint8 of a DS9 colormap'''
+    if cmap not in COLORMAPS:
+        raise ValueError('unknown colormap ' + str(cmap))
+    levels = np.linspace(0.0, 1.0, 256)
+    table = np.empty((256, 3), np.uint8)
+    for channel, (points, values) in enumerate(COLORMAPS[cmap]):
+        table[:, channel] = np.round(255 * np.interp(levels, points, values))
+    return table
+
+
+def scale_image(data, limmin, limmax, scale='log'):
+    '''Pixel values scaled to [0, 1] like DS9 does: clipped to limmin,
+    limmax and then linear, log, pow, sqrt or squared'''
+    limmin = float(limmin)
+    limmax = float(limmax)
+    x = (data - limmin) / ((limmax - limmin) or 1.0)
+    np.clip(x, 0.0, 1.0, out=x)
+    x[np.isnan(x)] = 0.0
+    if scale == 'log':
+        return np.log10(SCALE_EXPONENT * x + 1) / np.log10(SCALE_EXPONENT)
+    if scale in ('pow', 'power'):
+        return (SCALE_EXPONENT ** x - 1) / SCALE_EXPONENT
+    if scale == 'sqrt':
+        return np.sqrt(x)
+    if scale == 'squared':
+        return x * x
+    if scale == 'linear':
+        return x
+    raise ValueError('unknown scale ' + str(scale))
+
+
+def image_name(inputfile):
+    '''File name and extension of an image named as file.fits[1]'''
+    match = re.match(r'^(.*)\[(\d+)\]$', inputfile)
+    if match:
+        return match.group(1), int(match.group(2))
+    return inputfile, 0
+
+
+def decimated_image(inputfile, size=PNG_SIZE):
+    '''Every step-th pixel along both axes of an image, step being the
+    smallest keeping the sides within size, read from a memory map: only
+    the pages of the rows kept are read. Returns (float32 data, step)'''
+    filename, ext = image_name(inputfile)
+    with fits.open(filename, memmap=True,
+                   do_not_scale_image_data=True) as hdulist:
+        hdu = hdulist[ext]
+        header = hdu.header
+        step = int(np.ceil(max(hdu.shape) / float(size)))
+        raw = hdu.data[::step, ::step]
+        data = raw.astype(np.float32)
+        if 'BLANK' in header and raw.dtype.kind in 'iu':
+            data[raw == header['BLANK']] = np.nan
+    data *= header.get('BSCALE', 1.0)
+    data += header.get('BZERO', 0.0)
+    return data, step
+
+
+def shape_stamp(shape, size):
+    '''Pixel offsets (K, 2) of a region shape of size size (radius or half
+    side) around its centre: circle, box and the DS9 point shapes'''
+    radius = int(np.ceil(size))
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    if shape == 'box':
+        mask = np.maximum(abs(dx), abs(dy)) == radius
+    elif shape == 'diamond':
+        mask = abs(dx) + abs(dy) == radius
+    elif shape == 'cross':
+        mask = (dx == 0) | (dy == 0)
+    elif shape == 'x':
+        mask = abs(dx) == abs(dy)
+    elif shape == 'boxcircle':
+        mask = ((np.maximum(abs(dx), abs(dy)) == radius) |
+                (abs(np.hypot(dx, dy) - 0.7 * size) < 0.5))
+    else:
+        # circle, and the arrow drawn as one
+        mask = abs(np.hypot(dx, dy) - size) < 0.5
+    return np.column_stack([dx[mask], dy[mask]])
+
+
+def draw_stamps(rgb, x, y, stamp, color):
+    '''Sets the pixels of stamp around every point x, y of the array rgb
+    (rows, columns, 3) to color'''
+    ny, nx = rgb.shape[:2]
+    for start in range(0, len(x), BLOCK):
+        column = (np.round(x[start:start + BLOCK]).astype(np.intp)[:, None] +
+                  stamp[:, 0]).ravel()
+        row = (np.round(y[start:start + BLOCK]).astype(np.intp)[:, None] +
+               stamp[:, 1]).ravel()
+        inside = (column >= 0) & (column < nx) & (row >= 0) & (row < ny)
+        rgb[row[inside], column[inside]] = color
+
+
+def render_frame(inputfile, regions, pngfile, ds9cmap='grey',
+                 ds9limmin=0.0, ds9limmax=30.0, ds9scale='log',
+                 size=PNG_SIZE):
+    '''Draws an image and the regions of a list of RegionText to the PNG
+    file pngfile'''
+    from PIL import Image, ImageColor, ImageDraw
+
+    data, step = decimated_image(inputfile, size)
+    levels = scale_image(data, ds9limmin, ds9limmax, ds9scale)
+    # FITS rows go up, PNG rows down
+    rgb = colormap_table(ds9cmap)[
+        np.round(255 * levels[::-1]).astype(np.uint8)]
+    height = rgb.shape[0]
+
+    groups = parse_regions(''.join(region.getvalue() for region in regions))
+    if any(group[1] != 'image' for group in groups):
+        image = ImageWCS.from_file(*image_name(inputfile))
+
+    def pixels(x, y, system):
+        # 1-based image pixels (or sky) to the pixels of the PNG
+        if system != 'image':
+            x, y = image.world2pix(x, y)
+        return ((np.asarray(x) - 1) / step + 0.5,
+                height - ((np.asarray(y) - 1) / step + 0.5))
+
+    polygons = []
+    for color, system, shape, point, values in groups:
+        color = ImageColor.getrgb(color)
+        if shape == 'polygon':
+            x, y = pixels(values[:, 0::2].ravel(), values[:, 1::2].ravel(),
+                          system)
+            polygons.append((color, x.reshape(len(values), -1),
+                             y.reshape(len(values), -1)))
+            continue
+        x, y = pixels(values[:, 0], values[:, 1], system)
+        if point is not None:
+            # the size of the points is on the screen
+            stamp = shape_stamp(point[0], float(point[1]) / 2)
+        else:
+            # the radius of circles and side of boxes are on the image, but
+            # kept visible whatever the decimation
+            radius = values[0, 2] / 2 if shape == 'box' else values[0, 2]
+            stamp = shape_stamp(shape, max(radius / step, 2.0))
+        draw_stamps(rgb, x, y, stamp, color)
+
+    png = Image.fromarray(rgb)
+    draw = ImageDraw.Draw(png)
+    for color, x, y in polygons:
+        for xs, ys in zip(x, y):
+            draw.line(list(zip(xs.tolist(), ys.tolist())), fill=color)
+    png.save(pngfile)
+
+
+def render_frames(frames, outdir, ds9cmap='grey', ds9limmin=0.0,
+                  ds9limmax=30.0, ds9scale='log', size=PNG_SIZE):
+    '''Renders the frames of display(), (image, list of RegionText), to
+    outdir/footprints.png, or to outdir/footprints-<chip>.png for the chips
+    of a file with several images.
+    Returns the list of PNG files written'''
+    if not os.path.exists(outdir):
+        os.makedirs(outdir, mode=0o0755)
+
+    pngfiles = []
+    for inputfile, regions in frames:
+        if len(frames) == 1:
+            pngfile = os.path.join(outdir, 'footprints.png')
+        else:
+            chip = ImageWCS.from_file(*image_name(inputfile))
+            pngfile = os.path.join(outdir,
+                                   'footprints-{}.png'.format(chip.name))
+        print('rendering ' + pngfile)
+        render_frame(inputfile, regions, pngfile, ds9cmap, ds9limmin,
+                     ds9limmax, ds9scale, size)
+        pngfiles.append(pngfile)
+    return pngfiles
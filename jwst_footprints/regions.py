@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+DS9 region text formatted from whole arrays of coordinates.
+
+All the lines of a block of regions share one layout, so the block is
+formatted by a single %-format: the layout of a line repeated once per line,
+applied to the flat tuple of all their coordinates. The text of a file is
+then written at once.
+
+Regions are written either in image pixels or in sky coordinates, fk5 or
+icrs, in degrees; sky regions need no projection and fit any image of the
+field, their sizes being given in image pixels.
+
+A RegionText keeps the text of a region file in memory, to be sent to DS9
+as a data buffer, and writes it to its file only on request. parse_regions()
+reads such a text back into arrays, for the renderers other than DS9.
+"""
+from __future__ import absolute_import, division, print_function
+
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+# decimals of the pixel coordinates written
+PRECISION = 4
+
+# decimals of the sky coordinates written, in degrees (~0.04 mas)
+SKY_PRECISION = 8
+
+# coordinate systems of the region files
+REGION_SYSTEMS = ('image', 'fk5', 'icrs')
+
+# lines formatted at a time
+BLOCK = 1 << 16
+
+# the shapes of the regions written here
+REGION_SHAPES = ('polygon', 'circle', 'box', 'point')
+
+# a point line: values, point shape and size
+POINT_LINE = re.compile(r'^point\(([^)]*)\) # point=(\w+) (\S+)', re.M)
+
+
+def region_header(color, system='image'):
+    '''First lines of a region file: the global properties with the line
+    color and the coordinate system'''
+    return ('global color={} width=1 font="helvetica 15 normal roman" '
+            'select=0 highlite=1\n{}\n'.format(color, system))
+
+
+def system_format(system):
+    '''Precision of the coordinates and unit suffix of the sizes of the
+    regions in a coordinate system of REGION_SYSTEMS'''
+    if system not in REGION_SYSTEMS:
+        raise ValueError('unknown region coordinate system ' + str(system))
+    if system == 'image':
+        return (PRECISION, '')
+    # the sizes stay in image pixels whatever the image
+    return (SKY_PRECISION, 'i')
+
+
+def format_rows(layout, values):
+    '''Text of one line of the %-format layout per row of values (N, K),
+    K being the number of fields of layout'''
+    values = np.asarray(values, np.float64)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    text = []
+    for start in range(0, len(values), BLOCK):
+        block = values[start:start + BLOCK]
+        text.append((layout * len(block)) % tuple(block.ravel().tolist()))
+    return ''.join(text)
+
+
+def _number(precision, width=0):
+    return '%{}.{}f'.format(width or '', precision)
+
+
+def polygon_layout(nvertices, precision=PRECISION):
+    '''%-format of a polygon of nvertices vertices x1, y1, x2, y2...'''
+    number = _number(precision)
+    return ('polygon(' + ','.join([number + ',' + number] * nvertices) +
+            ') # text={}\n')
+
+
+def shape_layout(shape, radius, precision=PRECISION, unit=''):
+    '''%-format of a region of shape around x, y: circle, box (of side twice
+    radius) or one of the DS9 point shapes (diamond, cross, x, arrow,
+    boxcircle, of size radius in screen pixels). unit is the suffix of the
+    circle radius and box sides'''
+    number = _number(precision, 10)
+    radius = str(radius)
+    if shape == 'circle':
+        return ('circle(' + number + ',' + number + ',' + radius + unit +
+                ') # text={}\n')
+    if shape == 'box':
+        side = str(2 * float(radius)) + unit
+        return ('box(' + number + ',' + number + ',' + side + ',' + side +
+                ',0) # text={}\n')
+    return ('point(' + number + ',' + number + ') # point=' + shape + ' ' +
+            radius + ' text={}\n')
+
+
+def polygon_regions(x, y, precision=PRECISION):
+    '''Text of DS9 polygons, x, y (P, V) the coordinates of their V
+    vertices'''
+    x = np.atleast_2d(x)
+    y = np.atleast_2d(y)
+    values = np.empty(x.shape + (2,))
+    values[..., 0] = x
+    values[..., 1] = y
+    return format_rows(polygon_layout(x.shape[1], precision),
+                       values.reshape(len(x), -1))
+
+
+def shape_regions(x, y, shape='circle', radius=5, precision=PRECISION,
+                  unit=''):
+    '''Text of DS9 regions of shape (see shape_layout) around the points of
+    coordinates x, y'''
+    return format_rows(shape_layout(shape, radius, precision, unit),
+                       np.column_stack([np.ravel(x), np.ravel(y)]))
+
+
+def parse_regions(text):
+    '''Regions of a region text written by this module, the header of every
+    file included, as a list of (color, system, shape, point, values), one
+    per file, shape and point: shape the name of the regions (polygon,
+    circle, box, point), point the (shape, size) of the points or None and
+    values (N, K) the numbers of the N regions, the sizes of sky regions in
+    image pixels. The regions of a shape of a file have the same number of
+    values, as they are written by one layout'''
+    groups = []
+    for section in re.split(r'^(?=global )', text, flags=re.M):
+        lines = section.split('\n', 2)
+        if len(lines) < 3 or not lines[0].startswith('global '):
+            continue
+        color = re.match(r'global color=(\S+)', lines[0]).group(1)
+        system = lines[1].strip()
+        for shape in REGION_SHAPES:
+            layouts = OrderedDict()
+            if shape == 'point':
+                for args, point, size in POINT_LINE.findall(lines[2]):
+                    layouts.setdefault((point, size), []).append(args)
+            else:
+                layouts[None] = re.findall(r'^' + shape + r'\(([^)]*)\)',
+                                           lines[2], re.M)
+            for point, args in layouts.items():
+                if not args:
+                    continue
+                numbers = ','.join(args)
+                if system != 'image':
+                    # drop the unit of the sizes of sky regions
+                    numbers = re.sub(r'(?<=\d)i', '', numbers)
+                values = np.array(numbers.split(','), np.float64)
+                groups.append((color, system, shape, point,
+                               values.reshape(len(args), -1)))
+    return groups
+
+
+class RegionText(object):
+    """
+    Text of the region file filename, built by pieces with write(). It is
+    kept in memory when keep is true, for getvalue(), and also written to
+    the file when write is true; name is the file name, which also names
+    the regions in DS9 when the file is not written.
+    """
+
+    def __init__(self, filename, header='', keep=True, write=True):
+        self.name = filename
+        self.keep = keep
+        self._parts = []
+        self._file = None
+        if write:
+            self._file = open(filename, 'w')
+        self.write(header)
+
+    def write(self, text):
+        if self.keep:
+            self._parts.append(text)
+        if self._file is not None:
+            self._file.write(text)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def getvalue(self):
+        # joined once, the pieces of large source lists are many
+        if len(self._parts) > 1:
+            self._parts = [''.join(self._parts)]
+        return ''.join(self._parts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -24,6 +24,9 @@ setup(
         'pillow',
         'pyds9'
     ],
+    extras_require={
+        'export': ['regions', 'mocpy'],
+    },
 
     packages=find_packages(),
     package_data={
@@ -35,5 +38,8 @@ setup(
         'gui_scripts': [
             'jwst_footprints=jwst_footprints.gui.footprints:main',
         ],
+        'console_scripts': [
+            'jwst_footprints_batch=jwst_footprints.batch:main',
+        ],
     },
 )
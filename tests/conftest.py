@@ -0,0 +1,58 @@
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+# the default pointing of footprints()
+RA = 202.47
+DEC = 47.2
+
+
+def make_tan_header(ra=RA, dec=DEC, rotation=0.0, scale=1.0,
+                    shape=(500, 500)):
+    '''Header of a plain TAN image centred on ra, dec, rotated by rotation
+    degrees, of scale arcsec per pixel'''
+    header = fits.Header()
+    header['NAXIS'] = 2
+    header['NAXIS1'] = shape[1]
+    header['NAXIS2'] = shape[0]
+    header['CTYPE1'] = 'RA---TAN'
+    header['CTYPE2'] = 'DEC--TAN'
+    header['CRVAL1'] = ra
+    header['CRVAL2'] = dec
+    header['CRPIX1'] = shape[1] / 2.0
+    header['CRPIX2'] = shape[0] / 2.0
+    c = np.cos(np.radians(rotation)) * scale / 3600.0
+    s = np.sin(np.radians(rotation)) * scale / 3600.0
+    header['CD1_1'] = -c
+    header['CD1_2'] = s
+    header['CD2_1'] = s
+    header['CD2_2'] = c
+    return header
+
+
+@pytest.fixture
+def pointing():
+    '''ra, dec in degrees of the default pointing of footprints()'''
+    return (RA, DEC)
+
+
+@pytest.fixture
+def tan_header():
+    '''make_tan_header(ra, dec, rotation, scale, shape), centred on the
+    default pointing unless told otherwise'''
+    return make_tan_header
+
+
+@pytest.fixture
+def make_image(tmp_path):
+    '''Writes a small image with a make_tan_header() header and returns
+    its path'''
+    def make(name='image.fits', **kwargs):
+        header = make_tan_header(**kwargs)
+        data = np.zeros((header['NAXIS2'], header['NAXIS1']), np.float32)
+        path = str(tmp_path / name)
+        fits.PrimaryHDU(data, header).writeto(path)
+        return path
+    return make
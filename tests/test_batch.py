@@ -0,0 +1,42 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import pytest
+
+from jwst_footprints import batch
+from jwst_footprints.apertures import APERTURES
+
+
+@pytest.mark.parametrize('names', [('NGC 1', 'NGC_1'), ('m31', 'M31'),
+                                   ('a', 'a')])
+def test_names_sharing_a_directory(names, tmp_path):
+    targetfile = tmp_path / 'targets.txt'
+    targetfile.write_text(
+        u'name ra dec pa\n"b" 10.0 0.0 0.0\n"{}" 202.47 47.2 0.0\n'
+        u'"{}" 202.47 47.2 90.0\n'.format(*names))
+    outdir = tmp_path / 'out'
+    with pytest.raises(ValueError) as error:
+        batch.run(str(targetfile), str(outdir), processes=1)
+    assert 'targets 2 and 3' in str(error.value)
+    assert not outdir.exists()
+
+
+def test_run(tmp_path):
+    targetfile = tmp_path / 'targets.txt'
+    targetfile.write_text(
+        u'name ra dec pa dither instruments\n'
+        u'"NGC 1" 00:07:15.84 +27:42:29.1 10.0 FULL3 long,msa\n'
+        u'NGC_2 202.47 47.2 0.0 None short\n'
+        u'bad 202.47 47.2 0.0 FULL9 short\n')
+    outdir = str(tmp_path / 'out')
+    summaries = batch.run(str(targetfile), outdir, processes=1,
+                          system='fk5')
+    assert [x['status'] for x in summaries[:2]] == ['ok', 'ok']
+    assert summaries[2]['status'] == 'error: unknown dither pattern FULL9'
+    assert summaries[0]['npolygons'] == (3 * APERTURES['long'].napertures +
+                                         APERTURES['msa'].napertures)
+    assert sorted(os.listdir(outdir)) == ['NGC_1', 'NGC_2', 'summary.txt']
+    assert 'ds9-long-three.reg' in os.listdir(os.path.join(outdir, 'NGC_1'))
+    with open(os.path.join(outdir, 'summary.txt')) as fp:
+        assert len(fp.readlines()) == 4
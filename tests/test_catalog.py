@@ -0,0 +1,228 @@
+from __future__ import absolute_import, division, print_function
+
+import bz2
+import gzip
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from jwst_footprints.catalog import cached_catalog, open_catalog
+
+
+def _cache(task):
+    filename, cachedir = task
+    catalog = cached_catalog(filename, cachedir=cachedir)
+    return sum(len(ra) for start, ra, dec, codes in catalog.chunks())
+
+
+def test_index_concurrent(tmp_path):
+    # every process adds its files to the index of the shared cache
+    cachedir = str(tmp_path / 'cache')
+    os.makedirs(cachedir)
+    files = []
+    for k in range(32):
+        filename = str(tmp_path / 'list{}.txt'.format(k))
+        with open(filename, 'w') as fp:
+            for i in range(k + 1):
+                fp.write('{} {} F\n'.format(10.0 + i, k))
+        files.append(filename)
+
+    pool = multiprocessing.Pool(8)
+    try:
+        counts = pool.map(_cache, [(x, cachedir) for x in files], 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    assert counts == list(range(1, 33))
+    with open(os.path.join(cachedir, 'index.json')) as fp:
+        index = json.load(fp)
+    assert sorted(index) == sorted(os.path.abspath(x) for x in files)
+    assert not [x for x in os.listdir(cachedir) if x.endswith('.tmp')]
+
+
+def _write_list(filename, rows):
+    with open(filename, 'w') as fp:
+        fp.write('# ra dec type\n')
+        for row in rows:
+            fp.write(' '.join(str(x) for x in row) + '\n')
+
+
+def test_rows_with_wrong_columns(tmp_path):
+    # one row short of a column, a later one with an extra one: the tokens
+    # still divide evenly into rows
+    rows = [(10.0 + i, 20.0, 'F') for i in range(10)]
+    rows[3] = (13.0, 20.0)
+    rows[6] = (16.0, 20.0, 'F', 'P')
+    filename = str(tmp_path / 'list.txt')
+    _write_list(filename, rows)
+    for chunksize in (4, 100):
+        catalog = open_catalog(filename, chunksize=chunksize)
+        with pytest.raises(ValueError) as error:
+            list(catalog.chunks())
+        assert 'line 5: 2 columns instead of 3' in str(error.value)
+
+
+@pytest.mark.parametrize('compress', [gzip.open, bz2.BZ2File])
+def test_compressed(compress, tmp_path):
+    rng = np.random.RandomState(1)
+    ra = rng.uniform(0.0, 360.0, 1000)
+    dec = rng.uniform(-90.0, 90.0, 1000)
+    types = np.where(rng.uniform(size=1000) < 0.3, 'P', 'F')
+    suffix = '.gz' if compress is gzip.open else '.bz2'
+
+    textfile = str(tmp_path / 'list.txt')
+    _write_list(textfile, zip(ra.tolist(), dec.tolist(), types))
+    fitsfile = str(tmp_path / 'list.fits')
+    fits.BinTableHDU.from_columns([
+        fits.Column('RA', 'D', array=ra), fits.Column('DEC', 'D', array=dec),
+        fits.Column('TYPE', '1A', array=types)]).writeto(fitsfile)
+    npyfile = str(tmp_path / 'list.npy')
+    table = np.zeros(1000, [('ra', 'f8'), ('dec', 'f8'), ('type', 'U1')])
+    table['ra'] = ra
+    table['dec'] = dec
+    table['type'] = types
+    np.save(npyfile, table)
+
+    for filename in (textfile, fitsfile, npyfile):
+        with open(filename, 'rb') as fp, compress(filename + suffix,
+                                                  'wb') as out:
+            out.write(fp.read())
+        plain = _read(open_catalog(filename, chunksize=300))
+        packed = open_catalog(filename + suffix, chunksize=300)
+        assert type(packed) is type(open_catalog(filename))
+        assert _equal(_read(packed), plain)
+        assert np.array_equal(plain[0], ra)
+
+
+def _read(catalog):
+    chunks = list(catalog.chunks())
+    codes = np.concatenate([x[3] for x in chunks])
+    return (np.concatenate([x[1] for x in chunks]),
+            np.concatenate([x[2] for x in chunks]),
+            [catalog.categories[x] for x in codes])
+
+
+def _equal(a, b):
+    return (np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1]) and
+            a[2] == b[2])
+
+
+def _sources(n=50):
+    rng = np.random.RandomState(6)
+    ra = rng.uniform(0.0, 360.0, n)
+    dec = rng.uniform(-90.0, 90.0, n)
+    types = rng.choice(['P', 'F', 'X'], n)
+    return ra, dec, types
+
+
+def _check_chunks(catalog, ra, dec, types, chunksize):
+    chunks = list(catalog.chunks())
+    assert [x[0] for x in chunks] == list(range(0, len(ra), chunksize))
+    assert all(len(x[1]) == chunksize for x in chunks[:-1])
+    myra, mydec, mytypes = _read(catalog)
+    assert np.array_equal(myra, ra)
+    assert np.allclose(mydec, dec, rtol=0.0, atol=1e-6)
+    assert mytypes == types.tolist()
+
+
+def test_text_chunks(tmp_path):
+    # comments and blank lines between the rows do not shift the chunks
+    ra, dec, types = _sources()
+    filename = str(tmp_path / 'list.txt')
+    with open(filename, 'w') as fp:
+        fp.write('# ra dec type\n\n')
+        for i, row in enumerate(zip(ra.tolist(), dec.tolist(), types)):
+            fp.write('{!r} {!r} {} extra\n'.format(*row))
+            if i % 10 == 0:
+                fp.write('  # comment\n\n')
+    # the chunks count lines, comments included
+    catalog = open_catalog(filename, chunksize=8)
+    chunks = list(catalog.chunks())
+    assert sum(len(x[1]) for x in chunks) == 50
+    assert [x[0] for x in chunks] == list(np.cumsum(
+        [0] + [len(x[1]) for x in chunks[:-1]]))
+    assert _equal(_read(catalog), (ra, dec, types.tolist()))
+    assert catalog.has_types and catalog.ncolumns == 4
+
+    filename = str(tmp_path / 'plain.txt')
+    with open(filename, 'w') as fp:
+        for row in zip(ra.tolist(), dec.tolist()):
+            fp.write('{!r} {!r}\n'.format(*row))
+    catalog = open_catalog(filename, chunksize=7)
+    assert not catalog.has_types
+    assert all(x[3] is None for x in catalog.chunks())
+    assert np.array_equal(_read_plain(catalog), dec)
+
+
+def _read_plain(catalog):
+    return np.concatenate([x[2] for x in catalog.chunks()])
+
+
+def test_fits_chunks(tmp_path):
+    # a wider row than the columns read, a scaled column and a type column
+    # of several characters
+    ra, dec, types = _sources()
+    filename = str(tmp_path / 'list.fits')
+    fits.BinTableHDU.from_columns([
+        fits.Column('ID', 'K', array=np.arange(50)),
+        fits.Column('RA', 'D', array=ra),
+        fits.Column('MAG', 'E', array=np.ones(50)),
+        fits.Column('DEC', 'J', array=np.round(dec * 1e6).astype('i4')),
+        fits.Column('TYPE', '3A', array=np.char.add(types, 'x'))]).writeto(
+            filename)
+    fits.setval(filename, 'TSCAL4', value=1e-6, ext=1)
+    catalog = open_catalog(filename, chunksize=7)
+    _check_chunks(catalog, ra, dec, np.char.add(types, 'x'), 7)
+
+
+def test_npy_chunks(tmp_path):
+    ra, dec, types = _sources()
+    table = np.zeros(50, [('id', 'i4'), ('RAJ2000', '>f8'), ('dec', '<f4'),
+                          ('type', 'U3')])
+    table['RAJ2000'] = ra
+    table['dec'] = dec
+    table['type'] = types
+    filename = str(tmp_path / 'list.npy')
+    np.save(filename, table)
+    catalog = open_catalog(filename, chunksize=9)
+    _check_chunks(catalog, ra, dec.astype(np.float32), types, 9)
+
+
+def test_cache_round_trip(tmp_path, capsys):
+    ra, dec, types = _sources()
+    filename = str(tmp_path / 'list.txt')
+    _write_list(filename, zip(ra.tolist(), dec.tolist(), types))
+    cachedir = str(tmp_path / 'cache')
+    plain = _read(open_catalog(filename, chunksize=7))
+
+    catalog = cached_catalog(filename, chunksize=7, cachedir=cachedir)
+    assert 'parsing' in capsys.readouterr().out
+    _check_chunks(catalog, ra, dec, types, 7)
+    assert catalog.filename == filename
+
+    # read from the cache the second time, also under another name
+    copy = str(tmp_path / 'copy.txt')
+    with open(filename) as fp, open(copy, 'w') as out:
+        out.write(fp.read())
+    for name in (filename, copy):
+        catalog = cached_catalog(name, chunksize=11, cachedir=cachedir)
+        assert 'parsing' not in capsys.readouterr().out
+        assert _equal(_read(catalog), plain)
+    assert len([x for x in os.listdir(cachedir)
+                if x.endswith('.bin')]) == 1
+
+    # new content, new entry; the old one is evicted when over budget
+    _write_list(filename, zip(ra.tolist()[:10], dec.tolist()[:10],
+                              types[:10]))
+    catalog = cached_catalog(filename, cachedir=cachedir, budget=1)
+    assert 'parsing' in capsys.readouterr().out
+    assert len(_read(catalog)[0]) == 10
+    assert len([x for x in os.listdir(cachedir)
+                if x.endswith('.bin')]) == 1
+    catalog = open_catalog(copy, cache_budget=1 << 20)
+    assert type(catalog).__name__ == 'CachedCatalog'
@@ -0,0 +1,64 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from jwst_footprints.coverage import depth_map, depth_maps, source_membership
+from jwst_footprints.footprints import compute_footprints
+from jwst_footprints.image_wcs import ImageWCS
+
+
+def _exposures(footprints, image):
+    '''Number of distinct (dither, tile) exposures containing every pixel
+    centre, from the spherical membership of the centres'''
+    ny, nx = image.shape
+    y, x = np.mgrid[1:ny + 1, 1:nx + 1]
+    ra, dec = image.pix2world(x.ravel(), y.ravel())
+    membership = source_membership(footprints, ra, dec)
+    exposures = np.unique(np.array(
+        [membership['source'], membership['dither'], membership['tile']]).T,
+        axis=0)
+    return np.bincount(exposures[:, 0], minlength=x.size).reshape(ny, nx)
+
+
+def test_depth_per_instrument(make_image, pointing, tmp_path):
+    ra, dec = pointing
+    image = ImageWCS.from_file(make_image(scale=2.0))
+    fp = compute_footprints('Yes', 'Yes', 'Yes', ra, dec, 20.0, 'FULL3',
+                            ra, dec, 20.0)
+    outdir = str(tmp_path / 'maps')
+    os.makedirs(outdir)
+    files = depth_maps(fp, image, outdir)
+    assert [os.path.basename(x) for x in files] == [
+        'coverage-depth-long.fits', 'coverage-depth-short.fits',
+        'coverage-depth-msa.fits']
+
+    for instrument, mapfile in zip(('long', 'short', 'msa'), files):
+        selected = fp[fp['instrument'] == instrument]
+        depth = fits.getdata(mapfile)
+        assert depth.max() == len(np.unique(selected['dither']))
+        # the centres on an edge can fall either side
+        expected = _exposures(selected, image)
+        assert (depth != expected).mean() < 0.005
+
+
+def test_depth_map_one_instrument(make_image, pointing, tmp_path):
+    ra, dec = pointing
+    image = ImageWCS.from_file(make_image())
+    fp = compute_footprints('Yes', 'Yes', 'No', ra, dec, 0.0, 'FULL3')
+    with pytest.raises(ValueError):
+        depth_map(fp, image, str(tmp_path / 'depth.fits'))
+
+
+def test_depth_map_processes(make_image, pointing, tmp_path):
+    ra, dec = pointing
+    image = ImageWCS.from_file(make_image(scale=0.5))
+    fp = compute_footprints('No', 'Yes', 'No', ra, dec, 45.0, 'FULL6')
+    serial = depth_map(fp, image, str(tmp_path / 'serial.fits'), rows=64)
+    pooled = depth_map(fp, image, str(tmp_path / 'pooled.fits'), rows=64,
+                       processes=2)
+    assert fits.getdata(serial).any()
+    assert np.array_equal(fits.getdata(serial), fits.getdata(pooled))
@@ -0,0 +1,136 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import types
+
+import pytest
+
+from jwst_footprints.ds9_session import DS9Session
+from jwst_footprints.regions import RegionText, region_header, shape_regions
+
+
+class StubDS9(object):
+    """
+    pyds9.DS9 recording the commands set, and failing them once closed
+    """
+
+    started = []
+
+    def __init__(self):
+        self.commands = []
+        self.closed = False
+        StubDS9.started.append(self)
+
+    def get(self, command):
+        if self.closed:
+            raise ValueError('DS9 is gone')
+        return '1'
+
+    def set(self, command, data=None):
+        if self.closed:
+            raise ValueError('DS9 is gone')
+        self.commands.append(command if data is None else (command, data))
+
+
+@pytest.fixture
+def pyds9(monkeypatch):
+    module = types.ModuleType('pyds9')
+    module.DS9 = StubDS9
+    module.ds9_xpans = lambda: None
+    monkeypatch.setitem(sys.modules, 'pyds9', module)
+    StubDS9.started = []
+    return module
+
+
+def _regions(tmp_path, name, x):
+    return RegionText(str(tmp_path / name),
+                      region_header('green') + shape_regions([x], [x]),
+                      write=False)
+
+
+def _sent(d):
+    commands = list(d.commands)
+    del d.commands[:]
+    return commands
+
+
+def test_show_deltas(pyds9, make_image, tmp_path):
+    image = make_image()
+    other = make_image('other.fits')
+    session = DS9Session()
+
+    long_ = _regions(tmp_path, 'ds9-long-no.reg', 1.0)
+    short = _regions(tmp_path, 'ds9-short-no.reg', 2.0)
+    session.show([(image, [long_, short])])
+    d = StubDS9.started[0]
+    commands = _sent(d)
+    assert commands[:5] == ['tile yes', 'frame 1', 'cmap grey',
+                            'scale limits 0.0 30.0', 'scale log']
+    assert commands[5] == 'file ' + image
+    command, data = commands[6]
+    assert command == 'regions'
+    assert data.count('tag={ds9-long-no}') == 1
+    assert data.count('tag={ds9-short-no}') == 1
+    assert len(commands) == 7
+
+    # nothing changed, nothing sent but the frame
+    session.show([(image, [long_, short])])
+    assert _sent(d) == ['frame 1']
+
+    # one group changed: only that one is replaced
+    short = _regions(tmp_path, 'ds9-short-no.reg', 3.0)
+    session.show([(image, [long_, short])], ds9scale='linear')
+    commands = _sent(d)
+    assert commands[:3] == ['frame 1', 'scale linear',
+                            'regions group ds9-short-no delete']
+    assert commands[3][0] == 'regions'
+    assert 'ds9-long-no' not in commands[3][1]
+    assert len(commands) == 4
+
+    # a group gone is deleted, a second frame is added with everything
+    session.show([(image, [long_]), (other, [short])],
+                 ds9scale='linear')
+    commands = _sent(d)
+    assert commands[:2] == ['frame 1', 'regions group ds9-short-no delete']
+    assert commands[2:7] == ['frame 2', 'cmap grey', 'scale limits 0.0 30.0',
+                             'scale linear', 'file ' + other]
+    assert commands[7][0] == 'regions'
+    assert len(commands) == 8
+
+    # the frames left over are deleted
+    session.show([(image, [long_])], ds9scale='linear')
+    assert _sent(d) == ['frame 1', 'frame 2', 'frame delete']
+    assert len(StubDS9.started) == 1
+
+
+def test_show_image_rewritten(pyds9, make_image, tmp_path):
+    image = make_image()
+    regions = [_regions(tmp_path, 'ds9-msa.reg', 1.0)]
+    session = DS9Session()
+    session.show([(image, regions)])
+    d = StubDS9.started[0]
+    _sent(d)
+
+    # a new file under the same name is loaded again, with its regions
+    stat = os.stat(image)
+    os.utime(image, (stat.st_atime, stat.st_mtime + 10))
+    session.show([(image, regions)])
+    commands = _sent(d)
+    assert 'file ' + image in commands
+    assert commands[-1][0] == 'regions'
+
+
+def test_show_reconnects(pyds9, make_image, tmp_path):
+    image = make_image()
+    regions = [_regions(tmp_path, 'ds9-msa.reg', 1.0)]
+    session = DS9Session()
+    session.show([(image, regions)])
+    StubDS9.started[0].closed = True
+
+    # DS9 was closed: a new one is started and shown everything again
+    session.show([(image, regions)])
+    assert len(StubDS9.started) == 2
+    commands = StubDS9.started[1].commands
+    assert 'file ' + image in commands
+    assert commands[-1][0] == 'regions'
@@ -0,0 +1,153 @@
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+
+import astropy.units as u
+import numpy as np
+import pytest
+
+from jwst_footprints import batch, export
+from jwst_footprints.export import (EXPORT_FORMATS, export_footprints,
+                                    footprint_moc)
+from jwst_footprints.footprints import compute_footprints
+
+# pointings at the default field, across RA 0, across RA 180 and next to
+# the pole
+POINTINGS = [(202.47, 47.2), (0.01, -20.0), (180.0, 10.0), (359.99, 89.95)]
+
+
+def _footprints(ra, dec):
+    return compute_footprints('Yes', 'Yes', 'Yes', ra, dec, 33.0, 'FULL3',
+                              ra, dec, 71.0)
+
+
+def _inside_points(footprints, n=200, seed=0):
+    '''ra, dec of random points inside every aperture polygon: normalised
+    convex combinations of its vertices'''
+    rng = np.random.RandomState(seed)
+    ra = np.radians(footprints['ra'][:, :-1])
+    dec = np.radians(footprints['dec'][:, :-1])
+    vertices = np.stack([np.cos(ra) * np.cos(dec), np.sin(ra) * np.cos(dec),
+                         np.sin(dec)], axis=-1)
+    weights = rng.dirichlet(np.ones(vertices.shape[1]),
+                            (len(footprints), n))
+    points = np.einsum('pnv,pvj->pnj', weights, vertices).reshape(-1, 3)
+    points /= np.sqrt((points ** 2).sum(axis=1))[:, np.newaxis]
+    return (np.degrees(np.arctan2(points[:, 1], points[:, 0])) % 360.0,
+            np.degrees(np.arcsin(points[:, 2])))
+
+
+@pytest.mark.parametrize('ra, dec', POINTINGS)
+def test_stcs_geojson(ra, dec, tmp_path):
+    fp = _footprints(ra, dec)
+    stcs, geojson = export_footprints(fp, str(tmp_path))
+    assert os.path.basename(stcs) == 'footprints.stcs'
+
+    lines = open(stcs).read().splitlines()
+    assert len(lines) == len(fp)
+    for line, record in zip(lines, fp):
+        assert line.startswith('Polygon ICRS ')
+        values = np.array(line.split()[2:], np.float64).reshape(-1, 2)
+        assert np.allclose(values[:, 0], record['ra'][:-1], atol=1e-7)
+        assert np.allclose(values[:, 1], record['dec'][:-1], atol=1e-7)
+
+    features = json.load(open(geojson))['features']
+    assert len(features) == len(fp)
+    for feature, record in zip(features, fp):
+        assert feature['properties']['aperture'] == record['aperture']
+        geometry = feature['geometry']
+        rings = geometry['coordinates']
+        if geometry['type'] == 'MultiPolygon':
+            rings = [x[0] for x in rings]
+        for ring in rings:
+            ring = np.array(ring)
+            assert np.array_equal(ring[0], ring[-1])
+            # no edge goes round the globe
+            assert (np.abs(ring[:, 0]) <= 180.0).all()
+            assert (np.abs(np.diff(ring[:, 0])) < 180.0).all()
+            # counter-clockwise on the sky seen from outside, as RFC 7946
+            # asks
+            x, y = ring.T
+            assert (x[:-1] * y[1:] - x[1:] * y[:-1]).sum() > 0
+
+
+def _area(ring):
+    x, y = np.array(ring).T
+    return 0.5 * abs((x[:-1] * y[1:] - x[1:] * y[:-1]).sum())
+
+
+def test_geojson_antimeridian(tmp_path):
+    fp = _footprints(180.0, 10.0)
+    geojson, = export_footprints(fp, str(tmp_path), ['geojson'])
+    features = json.load(open(geojson))['features']
+    split = 0
+    for feature, record in zip(features, fp):
+        # the pieces add up to the polygon unwrapped around RA 180
+        area = _area(np.array([record['ra'], record['dec']]).T)
+        geometry = feature['geometry']
+        if geometry['type'] == 'MultiPolygon':
+            split += 1
+            assert len(geometry['coordinates']) == 2
+            pieces = [_area(x[0]) for x in geometry['coordinates']]
+            assert np.isclose(sum(pieces), area, rtol=1e-5)
+        else:
+            assert np.isclose(_area(geometry['coordinates'][0]), area,
+                              rtol=1e-5)
+    assert 0 < split < len(fp)
+
+
+def test_antimeridian_pole():
+    # a square around the north pole
+    lon = np.array([-135.0, -45.0, 45.0, 135.0, -135.0])
+    lat = np.full(5, 89.0)
+    ring, = export.antimeridian_rings(lon, lat)
+    ring = np.array(ring)
+    assert np.array_equal(ring[0], ring[-1])
+    # it is cut at the antimeridian and closed along the pole
+    assert sorted(np.abs(ring[:, 0]).tolist()).count(180.0) == 5
+    assert (ring[:, 1] == 90.0).sum() == 2
+    # the band between the ring and the pole
+    assert np.isclose(_area(ring), 360.0)
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_footprints(_footprints(*POINTINGS[0]), str(tmp_path), ['svg'])
+
+
+def test_missing_package(monkeypatch, tmp_path):
+    monkeypatch.setattr(export, 'MOC', None)
+    with pytest.raises(ImportError):
+        export.check_formats(['stcs', 'moc'])
+    targetfile = tmp_path / 'targets.txt'
+    targetfile.write_text(u'name ra dec pa\na 202.47 47.2 33.0\n')
+    # the batch stops before writing anything
+    outdir = tmp_path / 'out'
+    with pytest.raises(ImportError):
+        batch.run(str(targetfile), str(outdir), formats=['stcs', 'moc'])
+    assert not outdir.exists()
+
+
+def test_astropy_regions(tmp_path):
+    regions = pytest.importorskip('regions')
+    fp = _footprints(*POINTINGS[0])
+    regionfile, = export_footprints(fp, str(tmp_path), ['regions'])
+    assert regionfile.endswith(EXPORT_FORMATS['regions'][1])
+    assert len(regions.Regions.read(regionfile, format='ds9')) == len(fp)
+
+
+@pytest.mark.parametrize('ra, dec', POINTINGS)
+def test_moc_covers_polygons(ra, dec, tmp_path):
+    mocpy = pytest.importorskip('mocpy')
+    fp = _footprints(ra, dec)
+    moc = footprint_moc(fp, order=14)
+    inside_ra, inside_dec = _inside_points(fp)
+    assert moc.contains_lonlat(inside_ra * u.deg, inside_dec * u.deg).all()
+
+    # and nothing on the other side of the sky
+    far_ra = np.array([(ra + 180.0) % 360.0]) * u.deg
+    assert not moc.contains_lonlat(far_ra, np.array([-dec]) * u.deg).any()
+
+    mocfile, = export_footprints(fp, str(tmp_path), ['moc'])
+    assert mocpy.MOC.load(mocfile, 'fits') == footprint_moc(fp)
@@ -0,0 +1,116 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+import pytest
+
+from jwst_footprints.footprints import (DITHER_PATTERNS, attitude, attitudes,
+                                        compute_footprints, pa_sweep,
+                                        read_vertices, rotate_long,
+                                        rotate_msa, rotate_short,
+                                        write_pa_sweep)
+from jwst_footprints.footprints import pointing as vertex_pointing
+
+
+def test_write_pa_sweep_ifu(make_image, pointing, tmp_path):
+    ra, dec = pointing
+    pas = [0.0, 90.0]
+    sweep = pa_sweep(ra, dec, pas, instruments=('ifu', 'msa'))
+    imagefile = make_image()
+    outdir = str(tmp_path / 'sweep')
+    write_pa_sweep(sweep, pas, outdir, inputfile=imagefile,
+                   npzfile='sweep.npz', colors={'msa': 'red'})
+    names = sorted(os.listdir(outdir))
+    assert names == ['ds9-ifu-pa000.000.reg', 'ds9-ifu-pa090.000.reg',
+                     'ds9-msa-pa000.000.reg', 'ds9-msa-pa090.000.reg',
+                     'sweep.npz']
+    # the instruments left out of colors are drawn in green
+    assert 'color=green' in open(os.path.join(outdir, names[0])).read()
+    assert 'color=red' in open(os.path.join(outdir, names[2])).read()
+    arrays = np.load(os.path.join(outdir, 'sweep.npz'))
+    assert np.array_equal(arrays['ifu_ra'], sweep['ifu'][0])
+
+    # the default colors include the IFU
+    write_pa_sweep(sweep, pas, str(tmp_path / 'default'),
+                   inputfile=imagefile)
+    assert 'color=magenta' in open(str(
+        tmp_path / 'default' / 'ds9-ifu-pa000.000.reg')).read()
+
+
+# the dither positions of the original footprints(): V2, V3 shifts (arcsec)
+# of the rotation reference point, one list per pattern
+BASELINE_SHIFTS = {
+    'None': ([0.0], [0.0]),
+    'FULL3': ([0.0, -58.0, 58.0], [0.0, -23.5, 23.5]),
+    'FULL3TIGHT': ([0.0, -58.0, 58.0], [0.0, -7.5, 7.5]),
+    'FULL6': ([-72.0, -43.0, -14.0, 15.0, 44.0, 73.0],
+              [-30.0, -18.0, -6.0, 6.0, 18.0, 30.0]),
+}
+
+BASELINE_ROTATIONS = {'long': rotate_long, 'short': rotate_short,
+                      'msa': rotate_msa}
+
+
+def _baseline(instrument, ra, dec, pa, pattern='None'):
+    '''ra, dec of the vertices the way the original footprints() computed
+    them: one attitude() per dither position, one pointing() per vertex'''
+    v2, v3 = read_vertices(instrument)
+    xr, yr = BASELINE_ROTATIONS[instrument](v2, v3, 0.0)[2:]
+    if pattern == 'FULL6':
+        # the centre of the extreme positions of the long channel
+        xr, yr = rotate_long(*read_vertices('long') + (0.0,))[2:]
+        xr += 0.5
+    myra = []
+    mydec = []
+    for shiftv2, shiftv3 in zip(*BASELINE_SHIFTS[pattern]):
+        m = attitude(xr + shiftv2, yr + shiftv3, ra, dec, pa)
+        for k in range(len(v2)):
+            a = vertex_pointing(m, v2[k], v3[k])
+            myra.append(a[0])
+            mydec.append(a[1])
+    return np.array(myra), np.array(mydec)
+
+
+def _close(ra, dec, expected, tolerance=1e-9):
+    dra = (np.ravel(ra) - expected[0] + 180.0) % 360.0 - 180.0
+    return (np.abs(dra).max() < tolerance and
+            np.abs(np.ravel(dec) - expected[1]).max() < tolerance)
+
+
+@pytest.mark.parametrize('ra,dec,pa', [(202.47, 47.2, 0.0),
+                                       (0.01, -30.0, 137.5),
+                                       (359.99, 89.5, 271.0)])
+def test_footprints_baseline(ra, dec, pa):
+    assert set(DITHER_PATTERNS) == set(BASELINE_SHIFTS)
+    for pattern in DITHER_PATTERNS:
+        fp = compute_footprints('Yes', 'Yes', 'Yes', ra, dec, pa, pattern,
+                                ra, dec, pa)
+        for instrument in ('long', 'short', 'msa'):
+            selected = fp[fp['instrument'] == instrument]
+            expected = _baseline(instrument, ra, dec, pa,
+                                 'None' if instrument == 'msa' else pattern)
+            assert _close(selected['ra'], selected['dec'], expected)
+
+
+def test_attitudes_baseline():
+    rng = np.random.RandomState(2)
+    v2, v3 = rng.uniform(-600.0, 600.0, (2, 50))
+    ra = rng.uniform(0.0, 360.0, 50)
+    dec = rng.uniform(-90.0, 90.0, 50)
+    pa = rng.uniform(0.0, 360.0, 50)
+    matrices = attitudes(v2, v3, ra, dec, pa)
+    for i in range(50):
+        assert np.allclose(matrices[i],
+                           attitude(v2[i], v3[i], ra[i], dec[i], pa[i]),
+                           rtol=0.0, atol=1e-14)
+
+
+def test_pa_sweep_baseline(pointing):
+    ra, dec = pointing
+    pas = np.arange(0.0, 360.0, 22.5)
+    sweep = pa_sweep(ra, dec, pas, instruments=('long', 'short', 'msa'))
+    for instrument, (myra, mydec) in sweep.items():
+        for i, pa in enumerate(pas):
+            expected = _baseline(instrument, ra, dec, pa)
+            assert _close(myra[i], mydec[i], expected)
@@ -0,0 +1,90 @@
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from jwst_footprints import image_wcs
+from jwst_footprints.image_wcs import (CACHE_SIZE, ImageWCS, clear_cache,
+                                       image_chips)
+
+
+def _grid(image, margin=0.5):
+    '''ra, dec of a grid of points covering the image and beyond it'''
+    ny, nx = image.shape
+    x, y = np.meshgrid(np.linspace(-margin * nx, (1 + margin) * nx, 61),
+                       np.linspace(-margin * ny, (1 + margin) * ny, 61))
+    return image.pix2world(x.ravel(), y.ravel())
+
+
+@pytest.mark.parametrize('ra, dec, rotation, scale', [
+    (202.47, 47.2, 0.0, 1.0),
+    (202.47, 47.2, 33.0, 0.03),
+    (0.01, -30.0, 250.0, 0.5),
+    (359.99, 89.9, 71.0, 2.0),
+    (120.0, -89.5, 180.0, 0.1),
+])
+def test_tan_matches_wcslib(ra, dec, rotation, scale, tan_header):
+    image = ImageWCS(tan_header(ra, dec, rotation, scale))
+    assert image._tan is not None
+    ra, dec = _grid(image)
+    x, y = image.world2pix(ra, dec)
+    xw, yw = image.wcs.wcs_world2pix(ra, dec, 1)
+    assert np.abs(x - xw).max() < 1e-3
+    assert np.abs(y - yw).max() < 1e-3
+
+
+def _sip_header(tan_header):
+    header = tan_header(rotation=20.0)
+    header['CTYPE1'] = 'RA---TAN-SIP'
+    header['CTYPE2'] = 'DEC--TAN-SIP'
+    header['A_ORDER'] = 2
+    header['B_ORDER'] = 2
+    header['A_2_0'] = 1e-5
+    header['B_0_2'] = -1e-5
+    return header
+
+
+def _tpv_header(tan_header):
+    header = tan_header(rotation=20.0)
+    header['CTYPE1'] = 'RA---TPV'
+    header['CTYPE2'] = 'DEC--TPV'
+    header['PV1_1'] = 1.0
+    header['PV2_1'] = 1.0
+    header['PV1_4'] = 1e-3
+    return header
+
+
+@pytest.mark.parametrize('make_header', [_sip_header, _tpv_header])
+def test_distortion_falls_back_to_wcslib(make_header, tan_header):
+    image = ImageWCS(make_header(tan_header))
+    assert image._tan is None
+    ra, dec = _grid(image, margin=0.0)
+    x, y = image.world2pix(ra, dec)
+    xw, yw = image.wcs.wcs_world2pix(ra, dec, 1)
+    assert np.array_equal(x, xw)
+    assert np.array_equal(y, yw)
+
+
+def test_chip_cache_bounded(make_image, tan_header, tmp_path):
+    # a pipeline-like product: empty primary, SCI and ERR of two chips
+    hdus = [fits.PrimaryHDU()]
+    for k in range(2):
+        header = tan_header(rotation=10.0 * k)
+        for name in ('SCI', 'ERR'):
+            hdu = fits.ImageHDU(np.zeros((50, 50), np.float32), header)
+            hdu.header['EXTNAME'] = name
+            hdu.header['EXTVER'] = k + 1
+            hdus.append(hdu)
+    mef = str(tmp_path / 'mef.fits')
+    fits.HDUList(hdus).writeto(mef)
+    assert [x.name for x in image_chips(mef)] == ['SCI1', 'SCI2']
+
+    clear_cache()
+    for k in range(CACHE_SIZE + 5):
+        image_chips(make_image('image{}.fits'.format(k)))
+    assert len(image_wcs._cache) == CACHE_SIZE
+    assert len(image_wcs._chips_cache) == CACHE_SIZE
+    assert all(isinstance(x, ImageWCS) for x in image_wcs._cache.values())
+    clear_cache()
+    assert not image_wcs._cache and not image_wcs._chips_cache
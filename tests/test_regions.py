@@ -0,0 +1,112 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+
+from jwst_footprints import regions
+from jwst_footprints.catalog import open_catalog
+from jwst_footprints.footprints import source_regions
+from jwst_footprints.regions import (RegionText, format_rows, parse_regions,
+                                     polygon_regions, region_header,
+                                     shape_regions)
+
+
+def test_format_rows_blocks(monkeypatch):
+    # a few blocks, the last one short
+    monkeypatch.setattr(regions, 'BLOCK', 7)
+    rng = np.random.RandomState(3)
+    values = rng.uniform(-1000.0, 1000.0, (30, 3))
+    layout = 'box(%.4f,%10.4f) # text={%.2f}\n'
+    expected = ''.join(layout % tuple(row) for row in values.tolist())
+    assert format_rows(layout, values) == expected
+    assert format_rows('%.3f\n', values[:, 0]) == ''.join(
+        '%.3f\n' % x for x in values[:, 0])
+    assert format_rows(layout, np.zeros((0, 3))) == ''
+
+
+def test_polygon_regions():
+    rng = np.random.RandomState(4)
+    x, y = rng.uniform(0.0, 4000.0, (2, 6, 5))
+    text = polygon_regions(x, y)
+    lines = text.splitlines()
+    assert len(lines) == 6
+    assert lines[1] == 'polygon(' + ','.join(
+        '{:.4f},{:.4f}'.format(a, b) for a, b in zip(x[1], y[1])) + \
+        ') # text={}'
+
+    groups = parse_regions(region_header('blue') + text)
+    assert len(groups) == 1
+    color, system, shape, point, values = groups[0]
+    assert (color, system, shape, point) == ('blue', 'image', 'polygon',
+                                             None)
+    assert np.allclose(values[:, 0::2], x, rtol=0.0, atol=5e-5)
+    assert np.allclose(values[:, 1::2], y, rtol=0.0, atol=5e-5)
+
+
+def test_shape_regions_sky():
+    ra = np.array([10.123456789, 359.5, 0.25])
+    dec = np.array([-30.0, 89.9, 1e-9])
+    text = (region_header('red', 'fk5') +
+            shape_regions(ra, dec, 'circle', 5, 8, 'i') +
+            shape_regions(ra, dec, 'diamond', 7, 8))
+    assert 'circle(10.12345679,-30.00000000,5i) # text={}\n' in text
+    groups = parse_regions(text)
+    assert [x[2:4] for x in groups] == [('circle', None),
+                                        ('point', ('diamond', '7'))]
+    assert np.allclose(groups[0][4], np.column_stack([ra, dec, 3 * [5]]),
+                       rtol=0.0, atol=5e-9)
+    assert np.allclose(groups[1][4], np.column_stack([ra, dec]),
+                       rtol=0.0, atol=5e-9)
+
+
+def test_region_text(tmp_path):
+    filename = str(tmp_path / 'both.reg')
+    with RegionText(filename, region_header('green')) as text:
+        for k in range(3):
+            text.write(shape_regions([k], [k]))
+    assert text.getvalue() == open(filename).read()
+    assert text.getvalue().count('circle(') == 3
+
+    memory = RegionText(str(tmp_path / 'memory.reg'), 'header\n',
+                        write=False)
+    memory.write('line\n')
+    memory.close()
+    assert memory.getvalue() == 'header\nline\n'
+    assert not os.path.exists(memory.name)
+
+    filename = str(tmp_path / 'file.reg')
+    with RegionText(filename, 'header\n', keep=False) as text:
+        text.write('line\n')
+    assert text.getvalue() == ''
+    assert open(filename).read() == 'header\nline\n'
+
+
+def test_source_regions_chunks(tmp_path):
+    # the sources of every type, read a few at a time, keep their order
+    rng = np.random.RandomState(5)
+    ra = rng.uniform(10.0, 11.0, 40)
+    dec = rng.uniform(-5.0, 5.0, 40)
+    types = rng.choice(['P', 'F', 'X'], 40)
+    listfile = str(tmp_path / 'list.txt')
+    with open(listfile, 'w') as fp:
+        for row in zip(ra.tolist(), dec.tolist(), types):
+            fp.write('{!r} {!r} {}\n'.format(*row))
+
+    outdir = str(tmp_path / 'regions')
+    os.makedirs(outdir)
+    files = source_regions(open_catalog(listfile, chunksize=6), [None],
+                           [outdir], system='fk5')[0]
+    names = sorted(os.path.basename(x.name) for x in files)
+    assert names == ['ds9-sources-X.reg', 'ds9-sources-fillers.reg',
+                     'ds9-sources-primary.reg']
+    for text in files:
+        sourcetype = {'ds9-sources-X.reg': 'X',
+                      'ds9-sources-fillers.reg': 'F',
+                      'ds9-sources-primary.reg': 'P'}[
+                          os.path.basename(text.name)]
+        selected = types == sourcetype
+        assert text.getvalue() == open(text.name).read()
+        values = parse_regions(text.getvalue())[0][4]
+        assert np.allclose(values[:, 0], ra[selected], rtol=0.0, atol=5e-9)
+        assert np.allclose(values[:, 1], dec[selected], rtol=0.0, atol=5e-9)
@@ -0,0 +1,56 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from jwst_footprints.footprints import compute_footprints, footprint_regions
+from jwst_footprints.image_wcs import ImageWCS
+
+NAMES = {'long': 'three', 'short': 'three', 'msa': None}
+COLORS = {'long': 'blue', 'short': 'green', 'msa': 'red'}
+
+
+def _regions(job):
+    '''Footprints of one job projected on its image, as region texts'''
+    image, outdir, ra, dec, pa = job
+    fp = compute_footprints('Yes', 'Yes', 'Yes', ra, dec, pa, 'FULL3',
+                            ra, dec, pa)
+    centres = dict((x, (ra, dec)) for x in COLORS)
+    regions = footprint_regions(fp, image, outdir, NAMES, COLORS, centres)
+    texts = [(os.path.basename(x.name), x.getvalue()) for x in regions]
+    return fp, texts
+
+
+def _files(outdir):
+    return dict((name, open(os.path.join(outdir, name)).read())
+                for name in sorted(os.listdir(outdir)))
+
+
+def test_thread_pool_matches_serial(make_image, pointing, tmp_path):
+    ra, dec = pointing
+    images = [ImageWCS.from_file(make_image('image{}.fits'.format(k),
+                                            rotation=30.0 * k,
+                                            scale=1.0 + 0.2 * k))
+              for k in range(6)]
+    # every image on several jobs, an instance being shared by threads
+    jobs = [(images[k % len(images)], k, 15.0 * k) for k in range(24)]
+    serial = [(image, str(tmp_path / 'serial{}'.format(k)), ra, dec, pa)
+              for image, k, pa in jobs]
+    threaded = [(image, str(tmp_path / 'threaded{}'.format(k)), ra, dec, pa)
+                for image, k, pa in jobs]
+
+    expected = [_regions(job) for job in serial]
+    pool = ThreadPool(8)
+    try:
+        results = pool.map(_regions, threaded, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    for (fp, texts), (expected_fp, expected_texts), a, b in zip(
+            results, expected, serial, threaded):
+        assert np.array_equal(fp, expected_fp)
+        assert texts == expected_texts
+        assert _files(a[1]) == _files(b[1])